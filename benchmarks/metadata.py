@@ -0,0 +1,573 @@
+#!/usr/bin/env python3
+"""
+Benchmark the metadata parsers on synthetic inputs at realistic scale.
+
+Generates a fake cryosparc project, RELION star files and a Warp xml directory,
+then times the stemia code paths that read them. Each benchmark runs in a fresh
+process so that peak memory can be reported independently.
+
+Each repeat uses its own empty cache directory (XDG_CACHE_HOME), so the on-disk
+caches of stemia are only hit by the `*_cached` benchmarks, and the user's cache
+is never touched.
+
+Run `python benchmarks/metadata.py -h` for usage. Save results with `-o` and
+compare a later run against them with `-c` to catch regressions.
+"""
+
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import click
+import mrcfile
+import numpy as np
+import pandas as pd
+from rich import print
+from rich.table import Table
+
+PARTICLE_DTYPE = [
+    ("uid", "<u8"),
+    ("blob/path", "S80"),
+    ("blob/idx", "<u4"),
+    ("blob/shape", "<u4", (2,)),
+    ("blob/psize_A", "<f4"),
+    ("ctf/type", "S32"),
+    ("ctf/df1_A", "<f4"),
+    ("ctf/df2_A", "<f4"),
+    ("ctf/df_angle_rad", "<f4"),
+    ("ctf/accel_kv", "<f4"),
+    ("ctf/cs_mm", "<f4"),
+    ("alignments3D/split", "<u4"),
+    ("alignments3D/shift", "<f4", (2,)),
+    ("alignments3D/pose", "<f4", (3,)),
+    ("alignments3D/error", "<f4"),
+    ("alignments3D/class_posterior", "<f4"),
+    ("location/micrograph_uid", "<u8"),
+    ("location/micrograph_path", "S96"),
+    ("location/center_x_frac", "<f4"),
+    ("location/center_y_frac", "<f4"),
+]
+
+MICROGRAPH_DTYPE = [
+    ("uid", "<u8"),
+    ("micrograph_blob/path", "S96"),
+    ("micrograph_blob/shape", "<u4", (2,)),
+    ("micrograph_blob/psize_A", "<f4"),
+    ("ctf/df1_A", "<f4"),
+    ("ctf/df2_A", "<f4"),
+    ("ctf/ctf_fit_to_A", "<f4"),
+    ("ctf_stats/cross_corr_ctffind4", "<f4"),
+    ("ctf_stats/ice_thickness_rel", "<f4"),
+]
+
+STAR_COLUMNS = [
+    "rlnCoordinateX",
+    "rlnCoordinateY",
+    "rlnCoordinateZ",
+    "rlnAngleRot",
+    "rlnAngleTilt",
+    "rlnAnglePsi",
+    "rlnOriginXAngst",
+    "rlnOriginYAngst",
+    "rlnOriginZAngst",
+]
+
+
+def write_cs(path, dtype, n, rng, uid=None, strings=None):
+    """Write a synthetic cs file with n rows and random contents."""
+    arr = np.zeros(n, dtype=dtype)
+    for name in arr.dtype.names:
+        field = arr[name]
+        if field.dtype.kind == "f":
+            field[...] = rng.random(field.shape, dtype=np.float32)
+        elif field.dtype.kind == "u":
+            field[...] = rng.integers(0, 1000, field.shape)
+    arr["uid"] = rng.integers(0, 2**63, n, dtype=np.uint64) if uid is None else uid
+    for name, values in (strings or {}).items():
+        arr[name] = values
+    # np.save would add a .npy extension to a path
+    with open(path, "wb") as f:
+        np.save(f, arr)
+    return arr
+
+
+def write_job(job_dir, uid, job_type, parents, outputs, rng):
+    """Write a minimal cryosparc job.json."""
+    job_dir.mkdir(parents=True, exist_ok=True)
+    launched = 1_600_000_000_000 + int(rng.integers(0, 10**10))
+    started = launched + int(rng.integers(0, 10**7))
+    completed = started + int(rng.integers(0, 10**8))
+    meta = {
+        "uid": uid,
+        "type": job_type,
+        "parents": parents,
+        "output_results": [
+            {"group_name": group, "metafiles": files, "passthrough": passthrough}
+            for group, files, passthrough in outputs
+        ],
+        "launched_at": {"$date": launched},
+        "started_at": {"$date": started},
+        "completed_at": {"$date": completed},
+        "failed_at": None,
+        "interactive": False,
+        "run_on_master_direct": False,
+        "resources_needed": {"slots": {"CPU": 4, "GPU": 1, "RAM": 8}},
+    }
+    with open(job_dir / "job.json", "w") as f:
+        json.dump(meta, f)
+
+
+def make_cryosparc_project(root, n_particles, n_micrographs, n_jobs, rng):
+    """
+    Generate a synthetic cryosparc project.
+
+    The chain is: J1 (ctf) -> J2 (extract) -> J3 (refine). Additional filler jobs
+    with no outputs are added to reach n_jobs, to stress project-wide scans.
+    """
+    proj = root / "P1"
+    mic_uid = rng.integers(0, 2**63, n_micrographs, dtype=np.uint64)
+    mic_path = np.char.add(
+        b"J1/motioncorrected/", np.arange(n_micrographs).astype("S8")
+    )
+
+    (proj / "J1").mkdir(parents=True, exist_ok=True)
+    write_cs(
+        proj / "J1" / "J1_micrographs_ctf_estimated.cs",
+        MICROGRAPH_DTYPE,
+        n_micrographs,
+        rng,
+        uid=mic_uid,
+        strings={"micrograph_blob/path": mic_path},
+    )
+    write_job(
+        proj / "J1",
+        "J1",
+        "patch_ctf_estimation_multi",
+        [],
+        [("exposures", ["J1/J1_micrographs_ctf_estimated.cs"], False)],
+        rng,
+    )
+
+    (proj / "J2").mkdir(parents=True, exist_ok=True)
+    part_uid = rng.integers(0, 2**63, n_particles, dtype=np.uint64)
+    part_mic = rng.integers(0, n_micrographs, n_particles)
+    blob_path = np.char.add(b"J2/extract/", part_mic.astype("S8"))
+    write_cs(
+        proj / "J2" / "J2_particles.cs",
+        PARTICLE_DTYPE,
+        n_particles,
+        rng,
+        uid=part_uid,
+        strings={
+            "blob/path": blob_path,
+            "ctf/type": b"imported",
+            "location/micrograph_uid": mic_uid[part_mic],
+            "location/micrograph_path": mic_path[part_mic],
+        },
+    )
+    write_cs(
+        proj / "J2" / "J2_passthrough_micrographs.cs",
+        MICROGRAPH_DTYPE,
+        n_micrographs,
+        rng,
+        uid=mic_uid,
+        strings={"micrograph_blob/path": mic_path},
+    )
+    write_job(
+        proj / "J2",
+        "J2",
+        "extract_micrographs_multi",
+        ["J1"],
+        [
+            ("particles", ["J2/J2_particles.cs"], False),
+            ("micrographs", ["J2/J2_passthrough_micrographs.cs"], True),
+        ],
+        rng,
+    )
+
+    (proj / "J3").mkdir(parents=True, exist_ok=True)
+    write_cs(
+        proj / "J3" / "J3_002_particles.cs",
+        PARTICLE_DTYPE[:1] + PARTICLE_DTYPE[11:16],
+        n_particles,
+        rng,
+        uid=part_uid,
+    )
+    write_cs(
+        proj / "J3" / "J3_passthrough_particles.cs",
+        PARTICLE_DTYPE,
+        n_particles,
+        rng,
+        uid=part_uid,
+        strings={
+            "blob/path": blob_path,
+            "location/micrograph_uid": mic_uid[part_mic],
+            "location/micrograph_path": mic_path[part_mic],
+        },
+    )
+    write_job(
+        proj / "J3",
+        "J3",
+        "homo_refine_new",
+        ["J2"],
+        [
+            ("particles", ["J3/J3_002_particles.cs"], False),
+            ("particles", ["J3/J3_passthrough_particles.cs"], True),
+        ],
+        rng,
+    )
+
+    for idx in range(4, n_jobs + 1):
+        parents = [f"J{rng.integers(1, idx)}"]
+        write_job(proj / f"J{idx}", f"J{idx}", "class_2D", parents, [], rng)
+
+    return proj
+
+
+def make_star(path, n_rows, n_tomos, rng):
+    """Generate a RELION 3.1-style particle star file with an optics block."""
+    df = pd.DataFrame(
+        rng.random((n_rows, len(STAR_COLUMNS)), dtype=np.float32) * 1000,
+        columns=STAR_COLUMNS,
+    )
+    df.insert(0, "rlnMicrographName", rng.integers(0, n_tomos, n_rows))
+    df["rlnMicrographName"] = "TS_" + df["rlnMicrographName"].astype(str) + ".tomostar"
+    df["rlnOpticsGroup"] = 1
+    df["rlnImagePixelSize"] = 1.35
+    with open(path, "w") as f:
+        f.write("\ndata_optics\n\nloop_\n_rlnOpticsGroup #1\n_rlnImagePixelSize #2\n")
+        f.write("1 1.350000\n\n\ndata_particles\n\nloop_\n")
+        for idx, col in enumerate(df.columns, 1):
+            f.write(f"_{col} #{idx}\n")
+        df.to_csv(f, sep=" ", header=False, index=False, float_format="%.6f")
+
+
+def make_tomograms(tomo_dir, n_tomos, rng):
+    """Generate a directory of tiny tomograms, only their headers are used."""
+    tomo_dir.mkdir(parents=True, exist_ok=True)
+    for idx in range(n_tomos):
+        data = np.zeros((rng.integers(400, 600), 2, 2), dtype=np.float32)
+        with mrcfile.new(tomo_dir / f"TS_{idx}.mrc", data, overwrite=True) as mrc:
+            mrc.voxel_size = 10
+
+
+def make_warp_xml(warp_dir, n_files, rng):
+    """Generate a directory of Warp tilt image xml files."""
+    warp_dir.mkdir(parents=True, exist_ok=True)
+    grid = ";".join(
+        f"{x}|{y}" for x, y in rng.random((50, 2), dtype=np.float32).round(4)
+    )
+    nodes = "".join(
+        f'<Node X="{x}" Y="{y}" Z="0" Value="{v:.4f}" />'
+        for (x, y), v in zip(np.ndindex(8, 8), rng.random(64))
+    )
+    for idx in range(n_files):
+        angle = -60 + 3 * (idx % 41)
+        xml = (
+            '<?xml version="1.0" encoding="utf-8"?>\n'
+            f'<TiltSeries DataDirectory="" UnselectManual="False" Bfactor="0">'
+            '<CTF><Param Name="Defocus" Value="2.5" />'
+            '<Param Name="Voltage" Value="300" /></CTF>'
+            f'<GridCTF Width="8" Height="8" Depth="1">{nodes}</GridCTF>'
+            f"<PS1D>{grid}</PS1D>"
+            f"<SimulatedBackground>{grid}</SimulatedBackground>"
+            "</TiltSeries>"
+        )
+        name = f"TS_{idx // 41:03}_{idx % 41:03}_{angle:.1f}.xml"
+        (warp_dir / name).write_text(xml)
+
+
+def _run_command(cli, args):
+    """Run a click command without exiting and with output suppressed."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        cli.main(args, standalone_mode=False)
+
+
+def _check_not_cached():
+    """Make sure that the merged data was not written to the on-disk cache."""
+    from stemia.cryosparc.job_graph import cache_dir
+
+    csplot_cache = cache_dir() / "csplot"
+    if csplot_cache.exists() and any(csplot_cache.iterdir()):
+        raise RuntimeError(f"data was written to the cache in {csplot_cache}")
+
+
+def bench_find_cs_files(data):
+    """Find the cs files of the refinement job, building the job graph."""
+    from stemia.cryosparc.csplot.parse import find_cs_files
+    from stemia.cryosparc.job_graph import JobGraph
+
+    graph = JobGraph.from_project(data / "P1", cache=False)
+    find_cs_files(data / "P1" / "J3", graph=graph)
+
+
+def bench_find_cs_files_cached(data):
+    """Find the cs files of the refinement job, with the job graph cached."""
+    from stemia.cryosparc.csplot.parse import find_cs_files
+
+    find_cs_files(data / "P1" / "J3")
+
+
+def bench_read_cs_file(data):
+    """Read the largest particle cs file."""
+    from stemia.cryosparc.csplot.parse import read_cs_file
+
+    read_cs_file(data / "P1" / "J3" / "J3_passthrough_particles.cs")
+
+
+def bench_load_job_data(data):
+    """Load and merge all the data of the refinement job."""
+    from stemia.cryosparc.csplot.parse import load_job_data
+
+    load_job_data(data / "P1" / "J3", cache=False)
+    _check_not_cached()
+
+
+def bench_load_job_data_cached(data):
+    """Load all the data of the refinement job from the on-disk cache."""
+    from stemia.cryosparc.csplot.parse import load_job_data
+
+    load_job_data(data / "P1" / "J3")
+
+
+def bench_load_job_columns(data):
+    """Load and merge only a few columns of the refinement job."""
+    from stemia.cryosparc.csplot.parse import load_job_data
+
+    columns = ["ctf/df*", "alignments3D/pose"]
+    load_job_data(data / "P1" / "J3", columns=columns, cache=False)
+    _check_not_cached()
+
+
+def bench_time_wasted(data):
+    """Compute the time wasted on the project with useful jobs."""
+    from stemia.cryosparc.time_wasted import cli
+
+    _run_command(cli, [str(data / "P1"), "-u", "J3"])
+
+
+def bench_xml2dict(data):
+    """Parse all the Warp xml files."""
+    from stemia.utils.io_ import xml2dict
+
+    for xml in (data / "warp").glob("*.xml"):
+        xml2dict(str(xml))
+
+
+def bench_read_particle_star(data):
+    """Read the particle star file."""
+    from stemia.utils.io_ import read_particle_star
+
+    read_particle_star(data / "particles.star")
+
+
+def bench_edit_star(data):
+    """Run `relion edit_star` on the particle star file."""
+    from stemia.relion.edit_star import cli
+
+    # rlnOpticsGroup is the only column present in both blocks
+    args = [str(data / "particles.star"), "-c", "rlnOpticsGroup"]
+    _run_command(cli, [*args, "-i", "1", "-o", "1", "-f"])
+
+
+def bench_flip_z(data):
+    """Run `image flip_z` on the particle star file."""
+    from stemia.image.flip_z import cli
+
+    args = [str(data / "particles.star"), "-o", str(data / "flipped.star")]
+    _run_command(cli, [*args, "--mrc_pixel_size", "10", "--z_shape", "500"])
+
+
+def bench_flip_z_batch(data):
+    """Run `image flip_z` with per-tomogram shapes read from the tomogram headers."""
+    from stemia.image.flip_z import cli
+
+    args = [str(data / "particles.star"), "-o", str(data / "flipped.star")]
+    _run_command(cli, [*args, "--tomo_dir", str(data / "tomograms")])
+
+
+BENCHMARKS = {
+    "find_cs_files": bench_find_cs_files,
+    "find_cs_files_cached": bench_find_cs_files_cached,
+    "read_cs_file": bench_read_cs_file,
+    "load_job_data": bench_load_job_data,
+    "load_job_data_cached": bench_load_job_data_cached,
+    "load_job_columns": bench_load_job_columns,
+    "time_wasted": bench_time_wasted,
+    "xml2dict": bench_xml2dict,
+    "read_particle_star": bench_read_particle_star,
+    "edit_star": bench_edit_star,
+    "flip_z": bench_flip_z,
+    "flip_z_batch": bench_flip_z_batch,
+}
+# benchmarks of cache hits: they run once first, untimed, to fill the cache
+WARM_CACHE = {"find_cs_files_cached", "load_job_data_cached"}
+
+
+def _max_rss():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _measure(name, data, cache_home):
+    """Run a single benchmark, returning wall time and peak memory increase."""
+    os.environ["XDG_CACHE_HOME"] = cache_home
+    func = BENCHMARKS[name]
+    # warm up imports so they are not counted
+    with contextlib.suppress(Exception):
+        import stemia  # noqa: F401
+    before = _max_rss()
+    start = time.perf_counter()
+    try:
+        func(Path(data))
+    except Exception:
+        return {"error": traceback.format_exc(limit=1).strip().splitlines()[-1]}
+    elapsed = time.perf_counter() - start
+    return {"time": elapsed, "memory": _max_rss() - before}
+
+
+def run_benchmark(name, data, repeat):
+    """Run a benchmark `repeat` times, each in a fresh process and cache directory."""
+    results = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory(prefix="stemia_bench_cache_") as cache_home:
+            for _ in range(2 if name in WARM_CACHE else 1):
+                with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+                    res = pool.submit(_measure, name, str(data), cache_home).result()
+                if "error" in res:
+                    return res
+        results.append(res)
+    return {
+        "time": min(r["time"] for r in results),
+        "memory": max(r["memory"] for r in results),
+    }
+
+
+@click.command()
+@click.option(
+    "-n", "--particles", default=1_000_000, help="number of particles in .cs files"
+)
+@click.option("-m", "--micrographs", default=5000, help="number of micrographs")
+@click.option("-j", "--jobs", default=2000, help="number of jobs in the project")
+@click.option("-s", "--star-rows", default=1_000_000, help="rows in the star file")
+@click.option("-x", "--xml-files", default=2000, help="number of Warp xml files")
+@click.option(
+    "-k",
+    "--only",
+    multiple=True,
+    type=click.Choice(list(BENCHMARKS)),
+    help="only run these benchmarks (can be passed multiple times)",
+)
+@click.option("-r", "--repeat", default=3, help="repeats per benchmark (best time)")
+@click.option(
+    "-d",
+    "--data-dir",
+    type=click.Path(file_okay=False, resolve_path=True),
+    help="reuse (or generate and keep) synthetic data in this directory",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, resolve_path=True),
+    help="save results as json",
+)
+@click.option(
+    "-c",
+    "--compare",
+    type=click.Path(exists=True, dir_okay=False, resolve_path=True),
+    help="compare with previously saved json results and fail on regressions",
+)
+@click.option(
+    "-t",
+    "--tolerance",
+    default=0.2,
+    help="relative slowdown or memory increase considered a regression",
+)
+@click.option("--seed", default=0, help="seed for the synthetic data")
+def cli(
+    particles,
+    micrographs,
+    jobs,
+    star_rows,
+    xml_files,
+    only,
+    repeat,
+    data_dir,
+    output,
+    compare,
+    tolerance,
+    seed,
+):
+    """Benchmark metadata parsing on synthetic data."""
+    tmp = None
+    if data_dir is None:
+        tmp = data_dir = tempfile.mkdtemp(prefix="stemia_bench_")
+    data = Path(data_dir)
+    rng = np.random.default_rng(seed)
+
+    try:
+        if not (data / "P1").exists():
+            print(
+                f"Generating cryosparc project ({particles} particles, {jobs} jobs)..."
+            )
+            make_cryosparc_project(data, particles, micrographs, jobs, rng)
+        if not (data / "particles.star").exists():
+            print(f"Generating star file ({star_rows} rows)...")
+            make_star(data / "particles.star", star_rows, 500, rng)
+        if not (data / "tomograms").exists():
+            print("Generating tomograms (500 headers)...")
+            make_tomograms(data / "tomograms", 500, rng)
+        if not (data / "warp").exists():
+            print(f"Generating Warp directory ({xml_files} xml files)...")
+            make_warp_xml(data / "warp", xml_files, rng)
+
+        previous = {}
+        if compare is not None:
+            with open(compare) as f:
+                previous = json.load(f)
+
+        table = Table("benchmark", "time (s)", "peak memory (MB)", "change")
+        results = {}
+        regressions = []
+        for name in only or BENCHMARKS:
+            print(f"Running {name}...")
+            res = results[name] = run_benchmark(name, data, repeat)
+            if "error" in res:
+                table.add_row(name, "-", "-", f"[red]{res['error']}[/]")
+                continue
+            change = ""
+            if (prev := previous.get(name)) is not None and "error" not in prev:
+                dt = res["time"] / prev["time"] - 1
+                dm = (res["memory"] - prev["memory"]) / max(prev["memory"], 2**20)
+                change = f"time {dt:+.0%}, memory {dm:+.0%}"
+                if dt > tolerance or dm > tolerance:
+                    regressions.append(name)
+                    change = f"[red]{change}[/]"
+            table.add_row(
+                name, f"{res['time']:.3f}", f"{res['memory'] / 2**20:.1f}", change
+            )
+        print(table)
+
+        if output is not None:
+            with open(output, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    if regressions:
+        raise click.ClickException(f"regressions found in: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    os.environ.setdefault("PYTHONWARNINGS", "ignore")
+    cli()
@@ -0,0 +1,159 @@
+"""On-disk cache of merged job data, as uncompressed arrow (feather) files."""
+
+import hashlib
+import json
+import os
+import re
+import warnings
+from fnmatch import fnmatchcase
+
+from ..job_graph import cache_dir
+from .parse import KEY_COLUMNS, join_columns
+
+CACHE_VERSION = 1
+# least recently used entries are removed above this total size
+MAX_CACHE_SIZE = 20 * 2**30
+
+
+def cache_key(files, **options):
+    """
+    Cache key of the data merged from the given cs files.
+
+    The key changes if any file is modified, or if the options differ.
+    """
+    paths = sorted(
+        str(path)
+        for dct in files.values()
+        for file_set in dct.values()
+        for path in file_set
+    )
+    stats = []
+    for path in paths:
+        stat = os.stat(path)
+        stats.append((path, stat.st_mtime_ns, stat.st_size))
+    content = json.dumps([CACHE_VERSION, stats, sorted(options.items())])
+    return hashlib.sha1(content.encode()).hexdigest()
+
+
+def select_columns(names, columns):
+    """
+    Names of the flat columns matching the column patterns (see read_cs_file).
+
+    Like with cs files, patterns match whole fields: if any of the columns of a
+    vector field (e.g. `alignments3D/shift_0`) matches, all of them are selected.
+    """
+    if columns is None:
+        return list(names)
+    patterns = [*KEY_COLUMNS, *columns]
+    fields = {}
+    for name in names:
+        fields.setdefault(re.sub(r"_\d+$", "", name), []).append(name)
+    return [
+        name
+        for field, flat in fields.items()
+        if any(fnmatchcase(col, pat) for col in {field, *flat} for pat in patterns)
+        for name in flat
+    ]
+
+
+def _read_metadata(path):
+    """Column patterns stored with a cache entry, or False if it is not usable."""
+    import pyarrow as pa
+
+    try:
+        with pa.memory_map(str(path)) as source:
+            metadata = pa.ipc.open_file(source).schema.metadata or {}
+        content = json.loads(metadata[b"stemia"])
+    except (OSError, ValueError, KeyError, pa.ArrowException):
+        return False
+    if content.get("version") != CACHE_VERSION:
+        return False
+    return content["columns"]
+
+
+def _read_entry(path, columns):
+    import pyarrow as pa
+
+    with pa.memory_map(str(path)) as source:
+        reader = pa.ipc.open_file(source)
+        names = select_columns(reader.schema.names, columns)
+        table = reader.read_all().select(names)
+    # columns without missing values are used directly from the mapped file
+    df = table.to_pandas(split_blocks=True)
+    os.utime(path)
+    return df
+
+
+def _write_entry(path, df, columns):
+    import pyarrow as pa
+    import pyarrow.feather
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = {
+        **(table.schema.metadata or {}),
+        b"stemia": json.dumps({"version": CACHE_VERSION, "columns": columns}),
+    }
+    table = table.replace_schema_metadata(metadata)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    # uncompressed, so it can be memory-mapped when read back
+    pyarrow.feather.write_feather(table, tmp, compression="uncompressed")
+    tmp.replace(path)
+
+
+def evict(max_size=MAX_CACHE_SIZE, keep=()):
+    """Remove the least recently used cache entries above max_size (in bytes)."""
+    entries = []
+    for path in (cache_dir() / "csplot").glob("*.arrow"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime_ns, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        if path in keep:
+            continue
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def load_cached(key, columns, load, max_size=MAX_CACHE_SIZE):
+    """
+    Read job data from the cache, or load it with `load(columns)` and cache it.
+
+    Entries remember which columns they hold: requesting columns that are not in
+    the cache loads only those, and replaces the entry with one holding both.
+    Without pyarrow, the data is just loaded.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ModuleNotFoundError:
+        return load(columns)
+
+    path = cache_dir() / "csplot" / f"{key}.arrow"
+    cached = _read_metadata(path) if path.exists() else False
+    if cached is not False and (
+        cached is None or (columns is not None and set(columns) <= set(cached))
+    ):
+        return _read_entry(path, columns)
+
+    to_load = columns
+    df = None
+    if columns is not None and cached:
+        to_load = sorted({*cached, *columns})
+        new = load(sorted(set(columns) - set(cached)))
+        df = join_columns(_read_entry(path, None), new)
+    if df is None:
+        df = load(to_load)
+    if df is not None and not df.empty:
+        try:
+            _write_entry(path, df, to_load)
+            evict(max_size, keep=[path])
+        except OSError as e:
+            warnings.warn(f"could not write csplot cache: {e}", stacklevel=2)
+    if to_load != columns:
+        df = df[select_columns(df.columns, columns)]
+    return df
@@ -0,0 +1,119 @@
+"""Non-interactive export of job data and standard plots."""
+
+from pathlib import Path
+
+from .figures import binned_histogram
+from .parse import load_job_data
+
+
+def _micrographs(df):
+    """One row per micrograph."""
+    if "location/micrograph_uid" not in df.columns:
+        return df
+    return df.drop_duplicates("location/micrograph_uid")
+
+
+def plot_defocus(df):
+    """Histogram of the average defocus of each particle (or micrograph)."""
+    defocus = (df["ctf/df1_A"] + df["ctf/df2_A"]) / 2
+    return binned_histogram(defocus.rename("defocus (A)"))
+
+
+def plot_ctf_fit(df):
+    """Histogram of the CTF fit resolution of each micrograph."""
+    return binned_histogram(
+        _micrographs(df)["ctf/ctf_fit_to_A"].rename("CTF fit resolution (A)")
+    )
+
+
+def plot_particle_counts(df):
+    """Histogram of the number of particles in each micrograph."""
+    particles = df.dropna(subset=["uid", "location/micrograph_uid"])
+    counts = particles["location/micrograph_uid"].value_counts()
+    return binned_histogram(counts.rename("particles per micrograph"))
+
+
+# name: (function, columns needed)
+STANDARD_PLOTS = {
+    "defocus": (plot_defocus, ["ctf/df1_A", "ctf/df2_A"]),
+    "ctf_fit": (plot_ctf_fit, ["ctf/ctf_fit_to_A"]),
+    "particle_counts": (plot_particle_counts, ["uid", "location/micrograph_uid"]),
+}
+
+
+def export_name(job_dir):
+    """Prefix of the exported files of a job, unique across projects."""
+    job_dir = Path(job_dir)
+    return f"{job_dir.parent.name}_{job_dir.name}"
+
+
+def export_job(
+    job_dir,
+    outdir,
+    plots=tuple(STANDARD_PLOTS),
+    table_format="parquet",
+    image_format="png",
+    **kwargs,
+):
+    """
+    Write the merged data of a job as a table, and its standard plots as images.
+
+    Plots whose columns are not available for this job are skipped.
+    kwargs are passed to load_job_data.
+
+    Returns the paths of the written files.
+    """
+    outdir = Path(outdir)
+    prefix = export_name(job_dir)
+    if kwargs.get("columns") is not None:
+        # make sure the plotted columns are read too
+        needed = [col for plot in plots for col in STANDARD_PLOTS[plot][1]]
+        kwargs["columns"] = list(dict.fromkeys([*kwargs["columns"], *needed]))
+    df = load_job_data(job_dir, **kwargs).reset_index(drop=True)
+    if df.empty:
+        raise ValueError(f"no particle or micrograph data to export in {job_dir}")
+
+    written = []
+    table_path = outdir / f"{prefix}.{table_format}"
+    if table_format == "parquet":
+        df.to_parquet(table_path)
+    else:
+        df.to_feather(table_path)
+    written.append(table_path)
+
+    for plot in plots:
+        func, columns = STANDARD_PLOTS[plot]
+        if not set(columns).issubset(df.columns) or df[columns].isna().all().any():
+            continue
+        image_path = outdir / f"{prefix}_{plot}.{image_format}"
+        func(df).write_image(image_path)
+        written.append(image_path)
+
+    return written
+
+
+def export_jobs(job_dirs, outdir, jobs=4, progress=None, **kwargs):
+    """
+    Export many jobs in parallel with export_job, each in its own process.
+
+    kwargs are passed to export_job. Returns the jobs that failed, with their error.
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    failed = {}
+    if progress is not None:
+        task = progress.add_task("Exporting...", total=len(job_dirs))
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = {
+            pool.submit(export_job, job_dir, outdir, **kwargs): job_dir
+            for job_dir in job_dirs
+        }
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                # a broken job should not stop the whole batch
+                failed[futures[future]] = e
+            if progress is not None:
+                progress.update(task, advance=1)
+    return failed
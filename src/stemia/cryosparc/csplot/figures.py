@@ -0,0 +1,227 @@
+"""Plotly figures of job data, aggregated with numpy for large datasets."""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+
+modes = ["scatter", "histogram", "line"]
+histfuncs = ["count", "sum", "avg", "min", "max"]
+
+# above this many points, scatter and line plots are drawn with webgl
+WEBGL_THRESHOLD = 10_000
+# above this many points, data is aggregated before plotting
+AGGREGATE_THRESHOLD = 200_000
+# number of bins of density heatmaps (per axis) and of histograms
+BINS_2D = 256
+BINS = 200
+# line plots keep the min and max point of this many chunks
+LINE_BUCKETS = 2000
+# histograms and line decimation are not split by color above this many values
+MAX_COLOR_GROUPS = 50
+
+
+def _values(df, name):
+    """Column of a dataframe as a series, or its index if name is "index"."""
+    if name == "index":
+        return pd.Series(df.index, index=df.index, name="index")
+    return df[name]
+
+
+def _is_numeric(series):
+    return pd.api.types.is_numeric_dtype(series.dtype)
+
+
+def _as_float(series):
+    return series.to_numpy(dtype=float, na_value=np.nan)
+
+
+def _centers(edges):
+    return (edges[:-1] + edges[1:]) / 2
+
+
+def density_heatmap(x, y, color=None, bins=BINS_2D):
+    """
+    Heatmap of the number of points in each 2D bin.
+
+    With a numeric color column, shows the mean color of the points in each bin.
+    """
+    import plotly.graph_objects as go
+
+    xv = _as_float(x)
+    yv = _as_float(y)
+    finite = np.isfinite(xv) & np.isfinite(yv)
+    xv = xv[finite]
+    yv = yv[finite]
+    counts, xedges, yedges = np.histogram2d(xv, yv, bins=bins)
+    if color is not None and _is_numeric(color):
+        cv = _as_float(color)[finite]
+        valid = np.isfinite(cv)
+        edges = [xedges, yedges]
+        sums = np.histogram2d(xv[valid], yv[valid], bins=edges, weights=cv[valid])[0]
+        counts = np.histogram2d(xv[valid], yv[valid], bins=edges)[0]
+        z = sums / np.maximum(counts, 1)
+        title = f"mean {color.name}"
+    else:
+        z = counts
+        title = "count"
+    # empty bins are left transparent
+    z = np.where(counts > 0, z, np.nan)
+
+    fig = go.Figure(
+        go.Heatmap(
+            x=_centers(xedges),
+            y=_centers(yedges),
+            z=z.T,
+            colorbar={"title": title},
+            hoverongaps=False,
+        )
+    )
+    fig.update_layout(xaxis_title=x.name, yaxis_title=y.name)
+    return fig
+
+
+def binned_histogram(x, y=None, color=None, histfunc="count", bins=BINS):
+    """
+    Histogram computed with numpy, plotted as bars (like px.histogram).
+
+    Numeric x values are split in equal bins, other values are counted by category.
+    With y, the values of y in each bin are aggregated with histfunc.
+    """
+    import plotly.express as px
+
+    data = {"x": x.to_numpy()}
+    if _is_numeric(x):
+        xv = _as_float(x)
+        finite = np.isfinite(xv)
+        edges = np.histogram_bin_edges(xv[finite], bins=bins)
+        if finite.any() and np.ptp(xv[finite]) == 0:
+            # a single value: one unit-width bin centered on it
+            edges = xv[finite][0] + np.array([-0.5, 0.5])
+        elif pd.api.types.is_integer_dtype(x.dtype) and edges[-1] - edges[0] < bins:
+            # one bin per integer, to avoid empty bins in between
+            edges = np.arange(edges[0] - 0.5, edges[-1] + 1)
+        idx = np.clip(np.searchsorted(edges, xv, side="right") - 1, 0, len(edges) - 2)
+        data["x"] = np.where(finite, _centers(edges)[idx], np.nan)
+    keys = ["x"]
+    labels = {"x": x.name}
+    if color is not None:
+        if color.nunique() > MAX_COLOR_GROUPS:
+            warnings.warn(
+                f'"{color.name}" has too many values to split the histogram by color',
+                stacklevel=2,
+            )
+        else:
+            data["color"] = color.to_numpy()
+            keys.append("color")
+            labels["color"] = color.name
+    if y is None or histfunc == "count":
+        # like px.histogram, count rows (or the non-missing values of y)
+        data["value"] = np.ones(len(x)) if y is None else (~y.isna()).to_numpy()
+        func = "sum"
+    else:
+        data["value"] = _as_float(y)
+        func = "mean" if histfunc == "avg" else histfunc
+    labels["value"] = "count" if y is None else f"{histfunc} of {y.name}"
+
+    table = (
+        pd.DataFrame(data)
+        .dropna(subset=["x"])
+        .groupby(keys, observed=True, sort=True)["value"]
+        .agg(func)
+        .reset_index()
+    )
+    fig = px.bar(
+        table,
+        x="x",
+        y="value",
+        color="color" if "color" in keys else None,
+        labels=labels,
+    )
+    if _is_numeric(x):
+        fig.update_traces(width=edges[1] - edges[0])
+        fig.update_layout(bargap=0)
+    return fig
+
+
+def decimate_minmax(values, buckets=LINE_BUCKETS):
+    """
+    Positions of the points to keep to draw a line of the values.
+
+    The values are split in buckets of consecutive points, and only the minimum
+    and maximum of each bucket are kept, so peaks are preserved.
+    """
+    values = np.asarray(values, dtype=float)
+    n = len(values)
+    if n <= 2 * buckets:
+        return np.arange(n)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = values
+    padded = padded.reshape(buckets, size)
+    starts = np.arange(buckets) * size
+    # missing values are never picked, unless a whole bucket is missing
+    low = np.argmin(np.where(np.isnan(padded), np.inf, padded), axis=1)
+    high = np.argmax(np.where(np.isnan(padded), -np.inf, padded), axis=1)
+    keep = np.concatenate([starts + low, starts + high, [0, n - 1]])
+    return np.unique(keep[keep < n])
+
+
+def make_figure(
+    df, x, y=None, color=None, mode="scatter", histfunc="count", aggregate=None
+):
+    """
+    Plotly figure of dataframe columns (or of its index, with "index").
+
+    aggregate: aggregate the data with numpy before plotting: scatter plots become
+        density heatmaps, histograms are pre-binned and lines are decimated.
+        Default: only above AGGREGATE_THRESHOLD rows.
+    """
+    import plotly.express as px
+
+    if aggregate is None:
+        aggregate = len(df) > AGGREGATE_THRESHOLD
+    xs = _values(df, x)
+    ys = None if y is None else _values(df, y)
+    cs = None if color is None else _values(df, color)
+
+    if mode == "scatter":
+        if aggregate and ys is not None and _is_numeric(xs) and _is_numeric(ys):
+            return density_heatmap(xs, ys, cs)
+    elif mode == "histogram":
+        if aggregate:
+            return binned_histogram(xs, ys, cs, histfunc=histfunc)
+    elif mode == "line":
+        if aggregate:
+            line = xs if ys is None else ys
+            if cs is None or cs.nunique() > MAX_COLOR_GROUPS:
+                rows = decimate_minmax(_as_float(line))
+            else:
+                # keep the extremes of the line of each color
+                groups = pd.Series(np.arange(len(df))).groupby(
+                    cs.to_numpy(), observed=True, sort=False
+                )
+                rows = np.sort(
+                    np.concatenate(
+                        [
+                            pos[decimate_minmax(_as_float(line.iloc[pos]))]
+                            for pos in (g.to_numpy() for _, g in groups)
+                        ]
+                    )
+                )
+            df = df.iloc[rows]
+    else:
+        raise ValueError(f"unknown plot mode: {mode}")
+
+    kwargs = {
+        "data_frame": df,
+        "x": df.index if x == "index" else x,
+        "y": df.index if y == "index" else y,
+        "color": color,
+    }
+    if mode == "histogram":
+        return px.histogram(**kwargs, histfunc=histfunc)
+    kwargs["render_mode"] = "webgl" if len(df) > WEBGL_THRESHOLD else "svg"
+    if mode == "scatter":
+        return px.scatter(**kwargs)
+    return px.line(**kwargs)
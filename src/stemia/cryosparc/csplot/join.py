@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+
+
+def _nullable_dtype(dtype):
+    """Nullable equivalent of an integer or boolean numpy dtype (None otherwise)."""
+    if not isinstance(dtype, np.dtype):
+        return None
+    if dtype.kind == "b":
+        return "boolean"
+    if dtype.kind in "iu":
+        prefix = "UInt" if dtype.kind == "u" else "Int"
+        return f"{prefix}{dtype.itemsize * 8}"
+    return None
+
+
+def _to_nullable(df, exclude=()):
+    """Convert integer and boolean columns to the equivalent nullable dtypes."""
+    df = df.copy(deep=False)
+    for col in df.columns:
+        nullable = _nullable_dtype(df[col].dtype)
+        if col not in exclude and nullable is not None:
+            df[col] = df[col].astype(nullable)
+    return df
+
+
+def merge_outer(left, right, on):
+    """
+    Outer merge of two dataframes, using nullable dtypes only where needed.
+
+    Integer and boolean columns would be cast to float (losing precision, e.g. for
+    uids) on the side where the merge introduces missing values; only the columns
+    of that side are converted to nullable dtypes.
+    """
+    if not right[on].isin(left[on]).all():
+        left = _to_nullable(left, exclude=[on])
+    if not left[on].isin(right[on]).all():
+        right = _to_nullable(right, exclude=[on])
+    return pd.merge(left, right, on=on, how="outer")
+
+
+def take(values, indexer, has_missing=None):
+    """
+    Take values at indexer; -1 gives a missing value, like in a merge.
+
+    has_missing: whether indexer contains -1 (default: check)
+    """
+    if has_missing is None:
+        has_missing = bool((indexer == -1).any())
+    if not has_missing:
+        return values.take(indexer)
+    nullable = _nullable_dtype(values.dtype)
+    if nullable is not None:
+        # integers and booleans would otherwise be cast to float
+        values = pd.array(values, dtype=nullable)
+    return pd.api.extensions.take(values, indexer, allow_fill=True)
+
+
+def sort_keys(keys):
+    """Stable sorter of the keys, and the sorted keys."""
+    sorter = np.argsort(keys, kind="stable")
+    return sorter, keys[sorter]
+
+
+def lookup(sorter, sorted_keys, target):
+    """Index of each target in the (unique) sorted keys, or -1 if missing."""
+    if not len(sorted_keys):
+        return np.full(len(target), -1)
+    pos = np.searchsorted(sorted_keys, target)
+    pos_clipped = np.minimum(pos, len(sorted_keys) - 1)
+    found = (pos < len(sorted_keys)) & (sorted_keys[pos_clipped] == target)
+    return np.where(found, sorter[pos_clipped], -1)
+
+
+def outer_join(tables, on):
+    """
+    Outer join of dataframes on a key column.
+
+    Equivalent to successive pd.merge(how="outer") calls, where columns that are
+    already present in a previous table are dropped from the next ones. The keys
+    of all tables are sorted once, and each table is aligned to the result with
+    take indices, so every column is copied only once.
+
+    The first table can have duplicate keys (many-to-one joins, like particles to
+    micrographs); if any other table does, or if keys are missing, this falls back
+    to pandas' merge.
+
+    Like pandas, the result is sorted by key, with rows sharing the same key in
+    their original order; integer and boolean columns become nullable only if
+    the join introduces missing values.
+    """
+    if len(tables) == 1:
+        return tables[0]
+
+    keys = [table[on].to_numpy() for table in tables]
+    if not any(k.dtype == object for k in keys):
+        sorted_keys = [sort_keys(k) for k in keys]
+    if any(k.dtype == object for k in keys) or any(
+        (sk[1:] == sk[:-1]).any() for _, sk in sorted_keys[1:]
+    ):
+        # missing or mixed keys, or many-to-many joins
+        result = tables[0]
+        for table in tables[1:]:
+            table = table.drop(
+                columns=[c for c in result.columns if c != on], errors="ignore"
+            )
+            result = merge_outer(result, table, on=on)
+        return result
+
+    # result rows: all the rows of the first table, and one row for each key
+    # that is not in it, sorted by key (stable, so duplicates keep their order)
+    first_sorter, first_sorted = sorted_keys[0]
+    extra_keys = np.sort(
+        np.concatenate(
+            [
+                sk[lookup(first_sorter, first_sorted, sk) == -1]
+                for _, sk in sorted_keys[1:]
+            ]
+        )
+    )
+    new_key = np.ones(len(extra_keys), dtype=bool)
+    new_key[1:] = extra_keys[1:] != extra_keys[:-1]
+    extra_keys = extra_keys[new_key]
+    # two sorted runs, so this is a linear merge
+    all_keys = np.concatenate([first_sorted, extra_keys])
+    order = np.argsort(all_keys, kind="stable")
+    result_keys = all_keys[order]
+    first_indexer = np.concatenate([first_sorter, np.full(len(extra_keys), -1)])[order]
+
+    columns = {}
+    for idx, table in enumerate(tables):
+        if idx == 0:
+            indexer = first_indexer
+        else:
+            indexer = lookup(*sorted_keys[idx], result_keys)
+        has_missing = bool((indexer == -1).any())
+        for col in table.columns:
+            if col == on:
+                columns[col] = result_keys
+            elif col not in columns:
+                columns[col] = take(table[col].values, indexer, has_missing)
+
+    return pd.DataFrame(columns, copy=False)
@@ -1,9 +1,14 @@
 import click
 
+STANDARD_PLOTS = ["defocus", "ctf_fit", "particle_counts"]
+
 
 @click.command()
 @click.argument(
-    "job_dir", type=click.Path(exists=True, dir_okay=True, resolve_path=True)
+    "job_dirs",
+    nargs=-1,
+    required=True,
+    type=click.Path(exists=True, file_okay=False, resolve_path=True),
 )
 @click.option(
     "--drop-na",
@@ -12,7 +17,70 @@ import click
 )
 @click.option("--no-particles", is_flag=True, help="do not read particles data")
 @click.option("--no-micrographs", is_flag=True, help="do not read micrographs data")
-def cli(job_dir, drop_na, no_particles, no_micrographs):
+@click.option(
+    "-c",
+    "--columns",
+    multiple=True,
+    help="only read these columns at start (glob patterns such as 'ctf/*' are "
+    "allowed); other columns are read when first plotted",
+)
+@click.option(
+    "--io-workers",
+    type=int,
+    default=8,
+    help="number of cs files read at once",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help="do not use the on-disk cache of merged data (~/.cache/stemia/csplot)",
+)
+@click.option(
+    "-e",
+    "--export",
+    type=click.Path(file_okay=False),
+    help="instead of plotting interactively, write the data of each job (and "
+    "standard plots) to this directory",
+)
+@click.option(
+    "-p",
+    "--plot",
+    "plots",
+    multiple=True,
+    type=click.Choice(STANDARD_PLOTS),
+    help="standard plots written with --export [default: all]",
+)
+@click.option(
+    "--table-format",
+    type=click.Choice(["parquet", "feather"]),
+    default="parquet",
+    help="file format of the tables written with --export",
+)
+@click.option(
+    "--image-format",
+    type=click.Choice(["png", "svg", "pdf"]),
+    default="png",
+    help="file format of the plots written with --export",
+)
+@click.option(
+    "-j", "--jobs", type=int, default=4, help="number of jobs exported in parallel"
+)
+@click.option("-f", "--overwrite", is_flag=True, help="overwrite output if exists")
+def cli(
+    job_dirs,
+    drop_na,
+    no_particles,
+    no_micrographs,
+    columns,
+    io_workers,
+    no_cache,
+    export,
+    plots,
+    table_format,
+    image_format,
+    jobs,
+    overwrite,
+):
     """
     Read a cryosparc job directory and plot interactively any column.
 
@@ -20,25 +88,79 @@ def cli(job_dir, drop_na, no_particles, no_micrographs):
     An interactive ipython shell will be opened with data loaded
     into a pandas dataframe.
 
-    JOB_DIR:
-        a cryosparc job directory.
+    With --export, no window or shell is opened: each job is loaded in a separate
+    process, and its data and standard plots are written to files.
+
+    JOB_DIRS:
+        cryosparc job directories (only one, unless exporting).
     """
+    kwargs = {
+        "drop_na": drop_na,
+        "micrographs": not no_micrographs,
+        "particles": not no_particles,
+        "io_workers": io_workers,
+        "cache": not no_cache,
+    }
+
+    if export is not None:
+        from pathlib import Path
+
+        from rich import print
+        from rich.progress import Progress
+
+        from .export import export_jobs, export_name
+
+        outdir = Path(export)
+        outdir.mkdir(parents=True, exist_ok=True)
+        for job_dir in job_dirs:
+            output = outdir / f"{export_name(job_dir)}.{table_format}"
+            if output.exists() and not overwrite:
+                raise click.UsageError(f'{output} exists but "-f" flag was not passed')
+
+        with Progress() as progress:
+            failed = export_jobs(
+                job_dirs,
+                outdir,
+                jobs=jobs,
+                progress=progress,
+                plots=plots or STANDARD_PLOTS,
+                table_format=table_format,
+                image_format=image_format,
+                columns=columns or None,
+                **kwargs,
+            )
+        for job_dir, error in failed.items():
+            print(f"[red]failed to export {job_dir}: {error!r}")
+        if failed:
+            raise click.ClickException(f"{len(failed)} jobs could not be exported")
+        return
+
+    if len(job_dirs) > 1:
+        raise click.UsageError(
+            "multiple job directories can only be used with --export"
+        )
+    job_dir = job_dirs[0]
+
     from inspect import cleandoc
 
     from IPython.terminal.embed import InteractiveShellEmbed
 
-    from .parse import load_job_data
+    from .parse import LazyJobData, load_job_data
 
-    df = load_job_data(
-        job_dir,
-        drop_na=drop_na,
-        micrographs=not no_micrographs,
-        particles=not no_particles,
-    )
+    if columns:
+        data = LazyJobData(job_dir, columns=columns, **kwargs)
+        df = data.df
+    else:
+        data = df = load_job_data(job_dir, **kwargs)
+    if df.empty:
+        raise click.ClickException(
+            f"no particle or micrograph data found in {job_dir} "
+            "(check --no-particles and --no-micrographs)"
+        )
 
     from .plot import plot_df
 
-    plot_df(df)
+    plot_df(data)
 
     ipython_banner = cleandoc(
         """
@@ -48,7 +170,8 @@ def cli(job_dir, drop_na, no_particles, no_micrographs):
         - plotly.express as px
         Variables and functions:
         - parsed data loaded into `df` (pd.DataFrame)
-        - call `load_job_data(job_directory)` to read more data
+        - call `load_job_data(job_directory, columns=[...])` to read more data
+        - with --columns, `data.get([...])` reads more columns of this job
         - call `plot_df(dataframe)` on a dataframe to open the plotting widget
         - call `dataframe.to_csv(...) on a dataframe to save it as csv`
     """
@@ -56,6 +179,6 @@ def cli(job_dir, drop_na, no_particles, no_micrographs):
 
     sh = InteractiveShellEmbed(banner1=ipython_banner)
     sh.enable_gui("qt")
-    sh.push("df")
+    sh.push({"df": df, "data": data})
     sh.run_cell("df")
     sh()
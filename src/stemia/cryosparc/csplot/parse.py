@@ -1,11 +1,13 @@
-import json
 import re
 import warnings
+from fnmatch import fnmatchcase
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
+from .join import outer_join
+
 
 def update_dict(d1, d2):
     """Recursively update dict."""
@@ -15,15 +17,19 @@ def update_dict(d1, d2):
                 d1[k1][k2].update(d2[k1][k2])
 
 
-def find_cs_files(job_dir, sets=None, visited=None):
+def find_cs_files(job_dir, sets=None, visited=None, graph=None):
     """
     Recursively explore a job directory to find all the relevant cs files.
 
     This function recurses through all the parent jobs until it finds all the files
     required to have all the relevant info about the current job.
+
+    graph: JobGraph of the project (default: read it from the job's project)
     """
+    from ..job_graph import JobGraph
+
     if visited is None:
-        visited = []
+        visited = set()
 
     files = {
         "particles": {
@@ -36,10 +42,10 @@ def find_cs_files(job_dir, sets=None, visited=None):
         },
     }
     job_dir = Path(job_dir).absolute()
-    try:
-        with open(job_dir / "job.json") as f:
-            job = json.load(f)
-    except FileNotFoundError:
+    if graph is None:
+        graph = JobGraph.from_project(job_dir.parent)
+    job = graph.jobs.get(job_dir.name)
+    if job is None:
         warnings.warn(
             f'parent job "{job_dir.name}" is missing or corrupted', stacklevel=2
         )
@@ -100,13 +106,15 @@ def find_cs_files(job_dir, sets=None, visited=None):
                     file_set.remove(f)
 
     for parent in job["parents"]:
-        # avoid reparsing already visited jobs
-        if job["uid"] in visited:
+        # avoid exploring shared ancestors more than once
+        if parent in visited:
             continue
-        else:
-            visited.append(job["uid"])
+        visited.add(parent)
 
-        update_dict(files, find_cs_files(job_dir.parent / parent, visited=visited))
+        update_dict(
+            files,
+            find_cs_files(job_dir.parent / parent, visited=visited, graph=graph),
+        )
         if all(file_set for dct in files.values() for file_set in dct.values()):
             # found everything we need
             break
@@ -114,101 +122,283 @@ def find_cs_files(job_dir, sets=None, visited=None):
     return files
 
 
-def recarray_to_flat_dataframe(recarray, column_name=None):
-    """Split nested columns into individual columns of a dataframe."""
-    columns = []
+def _flat_columns(recarray, column_name=None):
+    """Recursively collect the (nested) fields of a structured array as columns."""
+    columns = {}
     if recarray.dtype.fields is not None:
         for col in recarray.dtype.names:
-            data = recarray_to_flat_dataframe(recarray[col], column_name=col)
-            columns.append(data)
+            columns.update(_flat_columns(recarray[col], column_name=col))
     elif recarray.ndim == 2:
-        for idx, subcolumn in enumerate(recarray.T):
-            columns.append(pd.Series(name=f"{column_name}_{idx}", data=subcolumn))
+        for idx in range(recarray.shape[1]):
+            columns[f"{column_name}_{idx}"] = recarray[:, idx]
+    elif recarray.dtype.kind == "S":
+        # paths and names repeat a lot: decode each unique value only once
+        codes, uniques = pd.factorize(recarray)
+        columns[column_name] = pd.Categorical.from_codes(
+            codes, [val.decode("utf-8") for val in uniques]
+        )
     else:
-        columns.append(pd.Series(name=column_name, data=recarray, dtype=recarray.dtype))
+        columns[column_name] = recarray
+    return columns
 
-    df = pd.concat(columns, axis=1)
 
-    # convert bytes to strings
-    for col in df.columns:
-        el = df[col].iloc[0]
-        if isinstance(el, bytes):
-            df[col] = df[col].str.decode("utf-8")
+def recarray_to_flat_dataframe(recarray, column_name=None):
+    """
+    Split nested columns into individual columns of a dataframe.
 
-    return df
+    Columns are views of the structured array (no data is copied), except byte
+    strings, which are converted to categoricals.
+    """
+    return pd.DataFrame(_flat_columns(recarray, column_name), copy=False)
 
 
-def read_cs_file(cs_file):
-    """Read a cs file into a dataframe."""
-    data = np.load(cs_file)
-    # convert dtypes ensure we allow NaN with stuff like integers
-    return recarray_to_flat_dataframe(data).convert_dtypes()
+# always read, as they are needed to merge data from different files
+KEY_COLUMNS = ("uid", "location/micrograph_uid")
 
 
-def load_job_data(job_dir, particles=True, micrographs=True, drop_na=False):
+def join_columns(df, other):
     """
-    Read a cryosparc job directory into a pandas dataframe.
+    Add the columns of other to df, if both have the same rows.
 
-    Returns a merged dataframe.
+    Data of a job read with different columns has the same rows, as they only
+    depend on the key columns. Returns None if the rows differ (e.g. if the cs
+    files changed in between).
     """
-    job_dir = Path(job_dir).resolve().absolute()
-    files = find_cs_files(job_dir)
+    keys = [col for col in KEY_COLUMNS if col in df.columns]
+    if (
+        len(df) != len(other)
+        or keys != [col for col in KEY_COLUMNS if col in other.columns]
+        or not df[keys]
+        .reset_index(drop=True)
+        .equals(other[keys].reset_index(drop=True))
+    ):
+        return None
+    added = [col for col in other.columns if col not in df.columns]
+    return pd.concat([df, other[added].set_axis(df.index, axis=0)], axis=1)
+
+
+def _flat_names(dtype):
+    """Map each field of a structured dtype to the names of its flat columns."""
+    return {
+        name: (
+            [name]
+            if not dtype[name].shape
+            else [f"{name}_{idx}" for idx in range(dtype[name].shape[0])]
+        )
+        for name in dtype.names
+    }
 
-    if not files["particles"]["cs"] and not files["micrographs"]["cs"]:
-        return pd.DataFrame()
+
+def cs_file_columns(cs_file):
+    """List the (flat) columns of a cs file, without reading its data."""
+    data = np.load(cs_file, mmap_mode="r")
+    return [col for cols in _flat_names(data.dtype).values() for col in cols]
+
+
+def read_cs_file(cs_file, columns=None, in_memory=False):
+    """
+    Read a cs file into a dataframe.
+
+    The file is memory-mapped, so only the data of the selected columns is read.
+
+    columns: columns to read (glob patterns such as `ctf/*` are allowed); key
+        columns needed for merging are always included. Default: all columns.
+    in_memory: read the selected data from disk right away, instead of when
+        the columns are first accessed
+    """
+    from numpy.lib.recfunctions import repack_fields
+
+    data = np.load(cs_file, mmap_mode="r")
+    if columns is not None:
+        patterns = [*KEY_COLUMNS, *columns]
+        fields = [
+            name
+            for name, flat in _flat_names(data.dtype).items()
+            if any(fnmatchcase(col, pat) for col in {name, *flat} for pat in patterns)
+        ]
+        data = data[fields]
+    if in_memory:
+        # a single pass over the file, copying only the selected fields
+        data = data.astype(repack_fields(data.dtype))
+    return recarray_to_flat_dataframe(data)
+
+
+def concat_dataframes(dfs):
+    """Concatenate dataframes, keeping categorical columns categorical."""
+    from pandas.api.types import union_categoricals
+
+    df = pd.concat(dfs, ignore_index=True)
+    for col in df.columns:
+        parts = [d[col] for d in dfs if col in d]
+        if len(parts) == len(dfs) and all(
+            isinstance(p.dtype, pd.CategoricalDtype) for p in parts
+        ):
+            # categories differ between files, which would result in object columns
+            df[col] = union_categoricals(parts)
+    return df
+
+
+def merge_job_data(files, particles=True, micrographs=True, columns=None, io_workers=8):
+    """
+    Read cs files (as found by find_cs_files) and merge them into a dataframe.
+
+    columns: only read these columns (glob patterns are allowed, see read_cs_file)
+    io_workers: number of cs files read at once
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    # e.g: micrographs-only jobs (ctf estimation)
+    particles = particles and bool(files["particles"]["cs"])
+    micrographs = micrographs and bool(files["micrographs"]["cs"])
 
     part_df = None
     mic_df = None
     df = None
 
+    kinds = []
     if particles:
-        part_data = [read_cs_file(part) for part in files["particles"]["cs"]]
-        part_passthrough = [
-            read_cs_file(part) for part in files["particles"]["passthrough"]
-        ]
+        kinds.append("particles")
+    if micrographs:
+        kinds.append("micrographs")
+    # with several workers, read the data in the threads rather than on access
+    in_memory = io_workers > 1
+    with ThreadPoolExecutor(io_workers) as pool:
+        # submit all the files at once, so reads overlap with flattening
+        futures = {
+            (k1, k2): [
+                pool.submit(read_cs_file, cs_file, columns=columns, in_memory=in_memory)
+                for cs_file in file_set
+            ]
+            for k1 in kinds
+            for k2, file_set in files[k1].items()
+        }
+        data = {
+            key: [future.result() for future in file_futures]
+            for key, file_futures in futures.items()
+        }
+
+    if particles:
+        part_data = data["particles", "cs"]
+        part_passthrough = data["particles", "passthrough"]
 
-        part_df = pd.concat(part_data, ignore_index=True)
-        if part_passthrough:
-            for pst in part_passthrough:
-                # keep only most recent data (non-passthrough)
-                to_drop = [col for col in part_df.columns if not col == "uid"]
-                pst.drop(columns=to_drop, errors="ignore", inplace=True)
-                part_df = pd.merge(part_df, pst, on="uid", how="outer")
+        # keep only most recent data (non-passthrough)
+        part_df = outer_join(
+            [concat_dataframes(part_data), *part_passthrough], on="uid"
+        )
 
         df = part_df
 
     if micrographs:
-        mic_data = [read_cs_file(mic) for mic in files["micrographs"]["cs"]]
-        mic_passthrough = [
-            read_cs_file(mic) for mic in files["micrographs"]["passthrough"]
-        ]
-
-        mic_df = pd.concat(mic_data, ignore_index=True)
-        if mic_passthrough:
-            for pst in mic_passthrough:
-                # keep only most recent data (non-passthrough)
-                to_drop = [col for col in mic_df.columns if not col == "uid"]
-                pst.drop(columns=to_drop, errors="ignore", inplace=True)
-                mic_df = pd.merge(mic_df, pst, on="uid", how="outer")
+        mic_data = data["micrographs", "cs"]
+        mic_passthrough = data["micrographs", "passthrough"]
 
+        # keep only most recent data (non-passthrough)
+        mic_df = outer_join([concat_dataframes(mic_data), *mic_passthrough], on="uid")
+        # need to rename or we have conflict with particle uid field
         mic_df.rename(columns={"uid": "location/micrograph_uid"}, inplace=True)
 
         if part_df is not None:
-            # need to rename or we have conflict with particle uid field
-            to_drop = [
-                col for col in part_df.columns if not col == "location/micrograph_uid"
-            ]
-            mic_df.drop(columns=to_drop, errors="ignore", inplace=True)
-            mic_df = pd.merge(
-                part_df, mic_df, on="location/micrograph_uid", how="outer"
-            )
+            mic_df = outer_join([part_df, mic_df], on="location/micrograph_uid")
 
         df = mic_df
 
+    # e.g. only micrograph data in the job, but micrographs were not requested
+    return pd.DataFrame() if df is None else df
+
+
+def load_job_data(
+    job_dir,
+    particles=True,
+    micrographs=True,
+    drop_na=False,
+    columns=None,
+    io_workers=8,
+    cache=True,
+):
+    """
+    Read a cryosparc job directory into a pandas dataframe.
+
+    columns: only read these columns (glob patterns are allowed, see read_cs_file)
+    io_workers: number of cs files read at once
+    cache: read the merged data from the on-disk cache if the cs files did not
+        change, and save it there otherwise (requires pyarrow)
+
+    Returns a merged dataframe (empty if the job has no data of the requested kind).
+    """
+    from .cache import cache_key, load_cached
+
+    job_dir = Path(job_dir).resolve().absolute()
+    files = find_cs_files(job_dir)
+
+    if not files["particles"]["cs"] and not files["micrographs"]["cs"]:
+        return pd.DataFrame()
+
+    def load(cols):
+        return merge_job_data(
+            files,
+            particles=particles,
+            micrographs=micrographs,
+            columns=cols,
+            io_workers=io_workers,
+        )
+
+    if cache and (particles or micrographs):
+        key = cache_key(files, particles=particles, micrographs=micrographs)
+        df = load_cached(key, columns, load)
+    else:
+        df = load(columns)
+
     # discard rows with no particles or no micrographs
-    if drop_na and df is not None:
+    if drop_na and not df.empty:
         no_parts = pd.isna(df.get("uid", np.array(False)))
         no_mics = pd.isna(df.get("location/micrograph_uid", np.array(False)))
         df = df[~(no_parts | no_mics)]
 
     return df
+
+
+class LazyJobData:
+    """
+    Data of a cryosparc job directory, with columns read on first use.
+
+    Only the fields of newly requested columns are read, and joined to the data
+    already loaded. kwargs are passed to load_job_data.
+    """
+
+    def __init__(self, job_dir, columns=(), **kwargs):
+        self.job_dir = job_dir
+        self.kwargs = kwargs
+        files = find_cs_files(job_dir)
+        available = dict.fromkeys(KEY_COLUMNS)
+        for dct in files.values():
+            for file_set in dct.values():
+                for cs_file in sorted(file_set):
+                    available.update(dict.fromkeys(cs_file_columns(cs_file)))
+        self.columns = list(available)
+        # flat columns already read (or not present after merging)
+        self.requested = set()
+        self.df = None
+        self.get(columns)
+
+    def get(self, columns):
+        """Return the data, reading any of the given columns not yet loaded."""
+        from .cache import select_columns
+
+        patterns = [col for col in columns if col not in (None, "index")]
+        missing = [
+            col
+            for col in select_columns(self.columns, patterns)
+            if col not in self.requested
+        ]
+        if self.df is not None and not missing:
+            return self.df
+        new = load_job_data(self.job_dir, columns=missing, **self.kwargs)
+        self.requested.update(missing)
+        df = new if self.df is None else join_columns(self.df, new)
+        if df is None:
+            # the cs files changed on disk: read everything again
+            df = load_job_data(
+                self.job_dir, columns=sorted(self.requested), **self.kwargs
+            )
+        self.df = df
+        return self.df
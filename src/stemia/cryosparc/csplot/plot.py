@@ -1,8 +1,7 @@
-import plotly.express as px
 from magicgui import magic_factory
 
-modes = [("scatter", px.scatter), ("histogram", px.histogram), ("line", px.line)]
-histfuncs = ["count", "sum", "avg", "min", "max"]
+from .figures import histfuncs, make_figure, modes
+from .parse import LazyJobData
 
 
 @magic_factory(
@@ -13,25 +12,30 @@ histfuncs = ["count", "sum", "avg", "min", "max"]
     color={"widget_type": "ComboBox"},
     mode={"choices": modes},
     histfunc={"choices": histfuncs},
+    aggregate={"choices": [("auto", None), ("on", True), ("off", False)]},
 )
-def plot_widget(dataframe, x, y, color, mode, histfunc):
+def plot_widget(dataframe, x, y, color, mode, histfunc, aggregate):
     """Widget for plotting dataframe data."""
-    if x == "index":
-        x = dataframe.index
-    if y == "index":
-        y = dataframe.index
-    kwargs = {"data_frame": dataframe, "x": x, "y": y, "color": color}
-    if mode is px.histogram:
-        kwargs["histfunc"] = histfunc
-    mode(**kwargs).show()
+    if isinstance(dataframe, LazyJobData):
+        # read the columns from disk only when they are needed
+        dataframe = dataframe.get([x, y, color])
+    make_figure(
+        dataframe,
+        x=x,
+        y=y,
+        color=color,
+        mode=mode,
+        histfunc=histfunc,
+        aggregate=aggregate,
+    ).show()
 
 
 def plot_df(dataframe):
-    """Plot a dataframe with plot_widget."""
+    """Plot a dataframe (or lazily loaded job data) with plot_widget."""
     pw = plot_widget()
     # set new dataframe as source and regenerate choices?
     pw.dataframe.value = dataframe
-    columns = ["index", *dataframe.columns.tolist()]
+    columns = ["index", *dataframe.columns]
     pw.x.choices = columns
     pw.y.choices = [None, *columns]
     pw.color.choices = [None, *columns]
@@ -0,0 +1,272 @@
+"""Data of many jobs of a project, sharing the columns read from common cs files."""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .join import lookup, sort_keys, take
+from .parse import concat_dataframes, find_cs_files, read_cs_file
+
+POSE_COLUMNS = ("alignments3D/pose_0", "alignments3D/pose_1", "alignments3D/pose_2")
+
+
+def _in_sorted(sorted_keys, values):
+    """Whether each value is in the (sorted) keys."""
+    if not len(sorted_keys):
+        return np.zeros(len(values), dtype=bool)
+    pos = np.minimum(np.searchsorted(sorted_keys, values), len(sorted_keys) - 1)
+    return sorted_keys[pos] == values
+
+
+class JobStore:
+    """
+    Data of many cryosparc jobs, with each cs file read only once.
+
+    Jobs of the same project share most of their data (e.g. the micrographs and
+    the extraction passthroughs). Here, every cs file is read into a single table
+    shared by all the jobs that use it, and each job only holds the positions of
+    its rows in those tables. Dataframes are only built on request, with get().
+
+    The rows of a job are its particles (or its micrographs, if it has none),
+    sorted by uid (or by location/micrograph_uid). Columns follow the same
+    precedence as load_job_data: the job's own cs files first, then passthroughs,
+    then micrograph data.
+
+    columns: only read these columns (glob patterns are allowed, see read_cs_file)
+    io_workers: number of cs files read at once
+    """
+
+    def __init__(self, columns=None, io_workers=8):
+        self.columns = columns
+        self.io_workers = io_workers
+        self.tables = {}
+        self.jobs = {}
+        self._graphs = {}
+        self._groups = {}
+        # cs files whose table was moved into a group: (group, first row, last row)
+        self._members = {}
+        self._sorted_uids = {}
+
+    def _read(self, paths):
+        """Read the cs files that are not in the store yet."""
+        paths = [
+            path
+            for path in paths
+            if path not in self.tables and path not in self._members
+        ]
+        with ThreadPoolExecutor(self.io_workers) as pool:
+            dfs = pool.map(
+                lambda path: read_cs_file(
+                    path, columns=self.columns, in_memory=self.io_workers > 1
+                ),
+                paths,
+            )
+            self.tables.update(zip(paths, dfs))
+
+    def _table(self, path):
+        """Table of a single cs file."""
+        if path in self.tables:
+            return self.tables[path]
+        group, start, stop = self._members[path]
+        return self._groups[group].iloc[start:stop].reset_index(drop=True)
+
+    def _group(self, paths):
+        """
+        Table of a group of cs files (e.g. the classes of a hetero refinement).
+
+        Once concatenated, the tables of the single files are dropped, so their
+        data is only held once.
+        """
+        if len(paths) == 1:
+            return self._table(paths[0])
+        if paths not in self._groups:
+            tables = [self._table(p) for p in paths]
+            self._groups[paths] = concat_dataframes(tables)
+            start = 0
+            for path, table in zip(paths, tables):
+                if path in self.tables:
+                    del self.tables[path]
+                    self._members[path] = (paths, start, start + len(table))
+                start += len(table)
+        return self._groups[paths]
+
+    def _align(self, paths, uids):
+        """Positions of the uids in the table of a group of cs files (-1 if missing)."""
+        if paths not in self._sorted_uids:
+            self._sorted_uids[paths] = sort_keys(self._group(paths)["uid"].to_numpy())
+        return lookup(*self._sorted_uids[paths], uids)
+
+    def add(self, job_dir, name=None):
+        """
+        Add a job to the store, reading only the cs files not already in it.
+
+        name: key of the job in the store (default: the job directory name)
+
+        Returns the name of the job.
+        """
+        from ..job_graph import JobGraph
+
+        job_dir = Path(job_dir).resolve()
+        name = job_dir.name if name is None else name
+        project_dir = job_dir.parent
+        if project_dir not in self._graphs:
+            self._graphs[project_dir] = JobGraph.from_project(project_dir)
+        files = find_cs_files(job_dir, graph=self._graphs[project_dir])
+        self._read(
+            sorted(
+                path
+                for dct in files.values()
+                for file_set in dct.values()
+                for path in file_set
+            )
+        )
+
+        # each group gives the columns it has to all the rows, by precedence
+        part_groups = self._file_groups(files["particles"])
+        mic_groups = self._file_groups(files["micrographs"])
+        groups = []
+        key = "uid"
+        if part_groups:
+            uids = self._union_uids(part_groups)
+            groups += [
+                (paths, self._align(paths, uids), "uid") for paths in part_groups
+            ]
+            if mic_groups and any(
+                "location/micrograph_uid" in self._group(paths).columns
+                for paths in part_groups
+            ):
+                job = {"key": key, "uids": uids, "groups": groups}
+                mic_uids = self._column(job, "location/micrograph_uid")
+                missing = pd.isna(mic_uids)
+                mic_uids = np.asarray(pd.array(mic_uids).fillna(0), dtype=np.uint64)
+                for paths in mic_groups:
+                    pos = self._align(paths, mic_uids)
+                    pos[missing] = -1
+                    groups.append((paths, pos, "location/micrograph_uid"))
+        elif mic_groups:
+            # like in load_job_data, micrograph uids keep their own name
+            key = "location/micrograph_uid"
+            uids = self._union_uids(mic_groups)
+            groups += [(paths, self._align(paths, uids), key) for paths in mic_groups]
+        else:
+            uids = np.array([], dtype=np.uint64)
+
+        self.jobs[name] = {"key": key, "uids": uids, "groups": groups}
+        return name
+
+    @staticmethod
+    def _file_groups(files):
+        groups = []
+        if files["cs"]:
+            groups.append(tuple(sorted(files["cs"])))
+        groups += [(path,) for path in sorted(files["passthrough"])]
+        return groups
+
+    def _union_uids(self, groups):
+        uids = np.sort(
+            np.concatenate([self._group(paths)["uid"].to_numpy() for paths in groups])
+        )
+        new = np.ones(len(uids), dtype=bool)
+        new[1:] = uids[1:] != uids[:-1]
+        return uids[new]
+
+    def columns_of(self, job):
+        """Names of the columns available for a job."""
+        columns = {self.jobs[job]["key"]: None}
+        for paths, _, key in self.jobs[job]["groups"]:
+            for col in self._group(paths).columns:
+                columns.setdefault(key if col == "uid" else col, None)
+        return list(columns)
+
+    def _column(self, job, col, rows=None):
+        """Values of a column for the rows of a job (or only the given rows)."""
+        if isinstance(job, str):
+            job = self.jobs[job]
+        if col == job["key"]:
+            return job["uids"] if rows is None else job["uids"][rows]
+        for paths, pos, key in job["groups"]:
+            table = self._group(paths)
+            if col == key:
+                name = "uid"
+            elif col == "uid":
+                # the uids of this table are named differently in this job
+                continue
+            else:
+                name = col
+            if name in table.columns:
+                if rows is not None:
+                    pos = pos[rows]
+                return take(table[name].values, pos)
+        raise KeyError(col)
+
+    def uids(self, job):
+        """Sorted uids of the rows of a job."""
+        return self.jobs[job]["uids"]
+
+    def get(self, job, columns=None):
+        """
+        Dataframe of a job.
+
+        columns: only these columns (glob patterns are allowed, see read_cs_file)
+        """
+        from .cache import select_columns
+
+        names = select_columns(self.columns_of(job), columns)
+        return pd.DataFrame({col: self._column(job, col) for col in names}, copy=False)
+
+    def diff(self, job_a, job_b):
+        """
+        Compare the rows of two jobs.
+
+        Returns a dict with the uids only in job_b (added), only in job_a
+        (removed), and in both (common).
+        """
+        a = self.uids(job_a)
+        b = self.uids(job_b)
+        a_in_b = _in_sorted(b, a)
+        return {
+            "added": b[~_in_sorted(a, b)],
+            "removed": a[~a_in_b],
+            "common": a[a_in_b],
+        }
+
+    def changed(self, job_a, job_b, columns=POSE_COLUMNS, tolerance=0):
+        """
+        Uids of the rows in both jobs whose values differ in the given columns.
+
+        tolerance: absolute difference under which numeric values are considered
+            the same
+        """
+        common = self.diff(job_a, job_b)["common"]
+        rows_a = np.searchsorted(self.uids(job_a), common)
+        rows_b = np.searchsorted(self.uids(job_b), common)
+        changed = np.zeros(len(common), dtype=bool)
+        for col in columns:
+            va = pd.Series(self._column(job_a, col, rows_a))
+            vb = pd.Series(self._column(job_b, col, rows_b))
+            if pd.api.types.is_numeric_dtype(va) and pd.api.types.is_numeric_dtype(vb):
+                va = va.to_numpy(dtype=float, na_value=np.nan)
+                vb = vb.to_numpy(dtype=float, na_value=np.nan)
+                different = np.abs(va - vb) > tolerance
+                different |= np.isnan(va) != np.isnan(vb)
+            else:
+                both_missing = (va.isna() & vb.isna()).to_numpy()
+                different = (va.astype(object) != vb.astype(object)).to_numpy()
+                different = different & ~both_missing
+            changed |= different
+        return common[changed]
+
+    @property
+    def nbytes(self):
+        """Memory used by the shared tables and the row positions of all jobs."""
+        tables = sum(
+            df.memory_usage(index=False).sum()
+            for df in [*self.tables.values(), *self._groups.values()]
+        )
+        rows = sum(
+            job["uids"].nbytes + sum(pos.nbytes for _, pos, _ in job["groups"])
+            for job in self.jobs.values()
+        )
+        return int(tables + rows)
@@ -0,0 +1,177 @@
+"""Project-wide graph of cryosparc jobs, with an on-disk cache."""
+
+import functools
+import hashlib
+import json
+import os
+import tempfile
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# job.json fields kept in the graph (the full files can be several MB each)
+JOB_FIELDS = (
+    "uid",
+    "type",
+    "parents",
+    "output_results",
+    "launched_at",
+    "started_at",
+    "completed_at",
+    "failed_at",
+    "interactive",
+    "resources_needed",
+    "run_on_master_direct",
+)
+# only the parts of output_results needed to find metadata files
+OUTPUT_FIELDS = ("group_name", "metafiles", "passthrough")
+CACHE_VERSION = 1
+
+
+def cache_dir():
+    """Cache directory for stemia, following the XDG specification."""
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "stemia"
+
+
+@functools.lru_cache(maxsize=None)
+def _json_loads():
+    """Fastest available json parser (orjson, if installed)."""
+    try:
+        import orjson
+    except ModuleNotFoundError:
+        return json.loads
+    return orjson.loads
+
+
+def _read_job(job_json):
+    with open(job_json, "rb") as f:
+        job = _json_loads()(f.read())
+    job = {k: job.get(k) for k in JOB_FIELDS}
+    job["output_results"] = [
+        {k: out.get(k) for k in OUTPUT_FIELDS} for out in job["output_results"] or []
+    ]
+    return job
+
+
+class JobGraph:
+    """
+    Graph of the jobs of a cryosparc project.
+
+    Built in a single parallel pass over all the J*/job.json files. The graph is
+    cached on disk, and only jobs whose job.json changed since are parsed again.
+    Parent and ancestor queries are answered in memory.
+    """
+
+    def __init__(self, project_dir, jobs, missing=()):
+        self.project_dir = Path(project_dir)
+        self.jobs = jobs
+        self.missing = sorted(missing)
+
+    @staticmethod
+    def cache_path(project_dir):
+        """Path of the cache file of a project."""
+        key = hashlib.sha1(str(Path(project_dir).resolve()).encode()).hexdigest()
+        return cache_dir() / "job_graph" / f"{key}.json"
+
+    @classmethod
+    def from_project(cls, project_dir, workers=16, cache=True):
+        """
+        Read the job graph of a project directory.
+
+        workers: number of job.json files read at once
+        cache: whether to use (and update) the on-disk cache
+        """
+        project_dir = Path(project_dir).resolve()
+        mtimes = {}
+        missing = []
+        with os.scandir(project_dir) as entries:
+            for entry in entries:
+                if not entry.name.startswith("J") or not entry.is_dir():
+                    continue
+                try:
+                    mtimes[entry.name] = os.stat(
+                        os.path.join(entry.path, "job.json")
+                    ).st_mtime_ns
+                except FileNotFoundError:
+                    missing.append(entry.name)
+
+        cached = {}
+        cache_path = cls.cache_path(project_dir)
+        if cache and cache_path.exists():
+            try:
+                with open(cache_path) as f:
+                    content = json.load(f)
+                if content.get("version") == CACHE_VERSION:
+                    cached = content["jobs"]
+            except (OSError, ValueError, KeyError):
+                cached = {}
+
+        jobs = {}
+        to_read = []
+        for name, mtime in mtimes.items():
+            entry = cached.get(name)
+            if entry is not None and entry["mtime"] == mtime:
+                jobs[name] = entry["job"]
+            else:
+                to_read.append(name)
+
+        def read(name):
+            try:
+                return name, _read_job(project_dir / name / "job.json")
+            except (OSError, ValueError):
+                return name, None
+
+        with ThreadPoolExecutor(workers) as pool:
+            for name, job in pool.map(read, to_read):
+                if job is None:
+                    missing.append(name)
+                    del mtimes[name]
+                else:
+                    jobs[name] = job
+
+        if cache and to_read:
+            content = {
+                "version": CACHE_VERSION,
+                "jobs": {
+                    name: {"mtime": mtimes[name], "job": job}
+                    for name, job in jobs.items()
+                },
+            }
+            try:
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                # unique temporary file, as other processes may write the same cache
+                with tempfile.NamedTemporaryFile(
+                    "w", dir=cache_path.parent, suffix=".tmp", delete=False
+                ) as f:
+                    try:
+                        json.dump(content, f)
+                    except BaseException:
+                        os.unlink(f.name)
+                        raise
+                os.replace(f.name, cache_path)
+            except OSError as e:
+                warnings.warn(f"could not write job graph cache: {e}", stacklevel=2)
+
+        return cls(project_dir, jobs, missing)
+
+    def parents(self, uid):
+        """Direct parents of a job."""
+        return list(self.jobs[uid]["parents"]) if uid in self.jobs else []
+
+    def ancestors(self, uids, include_self=True):
+        """
+        All the ancestors of the given jobs.
+
+        Parents that are missing from the project are included, but not explored.
+        """
+        if isinstance(uids, str):
+            uids = [uids]
+        seen = set(uids) if include_self else set()
+        stack = list(uids)
+        while stack:
+            for parent in self.parents(stack.pop()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        return seen
@@ -1,5 +1,104 @@
+from pathlib import Path
+
 import click
 
+TOTALS = ["running", "queued", "interactive", "cpu", "gpu", "useful"]
+
+
+def _to_ns(dates):
+    """
+    Convert cryosparc dates ({"$date": ms or iso string}) to int64 ns.
+
+    Also returns which dates are set.
+    """
+    import numpy as np
+    import pandas as pd
+
+    values = [None if d is None else d["$date"] for d in dates]
+    ns = np.zeros(len(values), dtype=np.int64)
+    is_int = np.array([isinstance(v, int) for v in values], dtype=bool)
+    ns[is_int] = np.array([v for v in values if isinstance(v, int)], dtype=np.int64)
+    ns[is_int] *= 1_000_000
+    is_str = np.array([isinstance(v, str) for v in values], dtype=bool)
+    if is_str.any():
+        # Timestamp.value is in ns (UTC for aware dates) with any version of pandas,
+        # and iso strings of different precisions can be mixed
+        ns[is_str] = [pd.Timestamp(v).value for v in values if isinstance(v, str)]
+    return ns, is_int | is_str
+
+
+def job_table(project_dir, useful_jobs=()):
+    """
+    Read the timing of all the jobs of a project into a dataframe (one row per job).
+
+    Times are in ns. Jobs that were not started or not finished are marked as
+    skipped, as well as jobs with missing metadata.
+    """
+    import numpy as np
+    import pandas as pd
+
+    from .job_graph import JobGraph
+
+    graph = JobGraph.from_project(project_dir)
+    useful = graph.ancestors(useful_jobs) if useful_jobs else set()
+    names = list(graph.jobs)
+    meta = list(graph.jobs.values())
+
+    launched, has_launched = _to_ns([m["launched_at"] for m in meta])
+    started, has_started = _to_ns([m["started_at"] for m in meta])
+    ended, has_ended = _to_ns([m["completed_at"] or m["failed_at"] for m in meta])
+    skipped = ~(has_started & has_ended)
+
+    slots = [(m["resources_needed"] or {}).get("slots") for m in meta]
+    master = np.array([bool(m.get("run_on_master_direct")) for m in meta], dtype=bool)
+    no_slots = np.array([s is None for s in slots], dtype=bool)
+    cpus = np.array([(s or {}).get("CPU", 0) for s in slots], dtype=np.int64)
+    gpus = np.array([(s or {}).get("GPU", 0) for s in slots], dtype=np.int64)
+    # jobs running directly on the master use a single cpu (I guess...)
+    cpus[no_slots & master] = 1
+
+    # int64 ns, so that sums are exact (like with timedelta)
+    running = np.where(skipped, 0, ended - started)
+    queued = np.where(skipped | ~has_launched, 0, started - launched)
+    df = pd.DataFrame(
+        {
+            "project": Path(project_dir).name,
+            "job": names,
+            "type": [m["type"] for m in meta],
+            "skipped": skipped,
+            "running": running,
+            "queued": queued,
+            "interactive": np.where([bool(m["interactive"]) for m in meta], running, 0),
+            "cpu": cpus * running,
+            "gpu": gpus * running,
+            "useful": np.where(np.isin(names, list(useful)), running, 0),
+        }
+    )
+    if graph.missing:
+        missing = pd.DataFrame(
+            {
+                "project": Path(project_dir).name,
+                "job": graph.missing,
+                "type": "unknown",
+                "skipped": True,
+                **{col: np.zeros(len(graph.missing), dtype=np.int64) for col in TOTALS},
+            }
+        )
+        df = pd.concat([df, missing], ignore_index=True)
+    return df, len(useful)
+
+
+def summarize(df, by):
+    """Sum job times by the given columns, in hours."""
+    summary = df.groupby(by, sort=True).agg(
+        jobs=("job", "size"),
+        skipped=("skipped", "sum"),
+        **{f"{col}_hours": (col, "sum") for col in TOTALS},
+    )
+    for col in TOTALS:
+        summary[f"{col}_hours"] /= 3.6e12
+    return summary.reset_index()
+
 
 @click.command()
 @click.argument(
@@ -17,143 +116,93 @@ import click
         "will be used to calculate useful time. Can be passed multiple times."
     ),
 )
-def cli(project_dirs, useful_jobs):
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="also write the totals per project and job type to a table "
+    "(.csv, .tsv or .parquet)",
+)
+@click.option(
+    "-j", "--jobs", type=int, default=4, help="number of projects read in parallel"
+)
+def cli(project_dirs, useful_jobs, output, jobs):
     """Print the total amount of time wasted on a project."""
     if len(project_dirs) > 1 and useful_jobs:
         raise click.UsageError(
             "do not provide useful_job when analysing more than one project"
         )
 
-    import json
-    import logging
-    from datetime import datetime, timedelta
-    from pathlib import Path
+    from concurrent.futures import ProcessPoolExecutor
+    from datetime import timedelta
+    from functools import partial
 
+    import pandas as pd
     from rich import print
-    from rich.logging import RichHandler
     from rich.progress import Progress
 
-    logging.basicConfig(
-        format="%(message)s",
-        datefmt="[%X]",
-        handlers=[RichHandler()],
-    )
-
-    logger = logging.getLogger(__name__)
-
-    with Progress() as prog:
-        for proj in prog.track(project_dirs, description="Reading projects..."):
-            proj = Path(proj)
-
-            total_running = timedelta(0)
-            total_queued = timedelta(0)
-            total_cpu = timedelta(0)
-            total_gpu = timedelta(0)
-            total_interactive = timedelta(0)
-            skipped = 0
-
-            parents = set()
-            total_useful = timedelta(0)
-
-            if useful_jobs:
-
-                def get_parents(job, proj, parents):
-                    with open(proj / job / "job.json") as f:
-                        meta = json.load(f)
-
-                    parents.add(job)
-                    for par in meta["parents"]:
-                        if par not in parents:
-                            get_parents(par, proj, parents)
-
-                for job in useful_jobs:
-                    get_parents(job, proj, parents)
-
-            jobs = list(proj.glob("J*"))
-            for job in prog.track(jobs, description="Reading jobs..."):
-                job_meta = job / "job.json"
-                if not job_meta.exists():
-                    logger.info(f"Missing job metadata for {job.name}, skipping.")
-                    skipped += 1
-                    continue
-                with open(job_meta) as f:
-                    meta = json.load(f)
-
-                start = meta["started_at"]
-                if start is None:
-                    logger.info(f"job {job.name} was not started, skipping")
-                    skipped += 1
-                    continue
-
-                launch = meta["launched_at"]
-
-                end = meta["completed_at"]
-                if end is None:
-                    end = meta["failed_at"]
-                if end is None:
-                    logger.info(f"job {job.name} was not finished, skipping")
-                    skipped += 1
-                    continue
-
-                if isinstance(end["$date"], int):
-                    running = timedelta(milliseconds=end["$date"] - start["$date"])
-                    queued = timedelta(milliseconds=start["$date"] - launch["$date"])
-                elif isinstance(end["$date"], str):
-                    running = datetime.fromisoformat(
-                        end["$date"]
-                    ) - datetime.fromisoformat(start["$date"])
-                    queued = datetime.fromisoformat(
-                        start["$date"]
-                    ) - datetime.fromisoformat(launch["$date"])
-
-                total_queued += queued
-
-                if meta["interactive"]:
-                    total_interactive += running
-
-                resources = meta["resources_needed"].get("slots", None)
-                if resources is None and meta.get("run_on_master_direct", False):
-                    cpus = 1 * running  # I guess...
-                    gpus = 0 * running
-                else:
-                    cpus = resources.get("CPU", 0) * running
-                    gpus = resources.get("GPU", 0) * running
-
-                total_running += running
-
-                if useful_jobs and job.name in parents:
-                    total_useful += running
-
-                total_cpu += cpus
-                total_gpu += gpus
-
-            tot_with_queue = total_running + total_queued
+    def fmt(ns):
+        td = timedelta(microseconds=int(ns) // 1000)
+        return f"{td.days} days and {int(td.seconds / 3600)} hours"
+
+    tables = []
+    with Progress() as prog, ProcessPoolExecutor(jobs) as pool:
+        results = pool.map(partial(job_table, useful_jobs=useful_jobs), project_dirs)
+        for proj, (df, n_useful) in prog.track(
+            zip(project_dirs, results),
+            total=len(project_dirs),
+            description="Reading projects...",
+        ):
+            tables.append(df)
+            totals = df.loc[~df["skipped"], TOTALS].sum()
+            skipped = int(df["skipped"].sum())
+
+            tot_with_queue = totals["running"] + totals["queued"]
             print(
                 "================================================================================"
             )
             print(
-                f"Time wasted by processors on [green]{proj.name}[/]: "
-                f"[bold red]{total_running.days} days and {int(total_running.seconds / 3600)} hours[/].\n"
+                f"Time wasted by processors on [green]{Path(proj).name}[/]: "
+                f"[bold red]{fmt(totals['running'])}[/].\n"
                 f"Time wasted by you sitting in interactive jobs: "
-                f"[bold red]{total_interactive.days} days and {int(total_interactive.seconds / 3600)} hours[/].\n"
+                f"[bold red]{fmt(totals['interactive'])}[/].\n"
                 "Counting queue time: "
-                f"[bold red]{tot_with_queue.days} days and {int(tot_with_queue.seconds / 3600)} hours[/].\n"
+                f"[bold red]{fmt(tot_with_queue)}[/].\n"
             )
             print(
                 "If this project had been running on a single average CPU core\n"
                 "and a single average GPU, it would have taken:\n"
-                f"[bold red]{total_cpu.days} days and {int(total_cpu.seconds / 3600)} hours[/] of CPU time and\n"
-                f"[bold red]{total_gpu.days} days and {int(total_gpu.seconds / 3600)} hours[/] of GPU time.\n"
+                f"[bold red]{fmt(totals['cpu'])}[/] of CPU time and\n"
+                f"[bold red]{fmt(totals['gpu'])}[/] of GPU time.\n"
             )
             if useful_jobs:
                 print(
                     f"The useful jobs ([green]{', '.join(useful_jobs)}[/] "
-                    f"and their {len(parents) - len(useful_jobs)} parents) ran for: "
-                    f"[bold red]{total_useful.days} days and {int(total_useful.seconds / 3600)} hours[/].\n"
-                    f"Which means you wasted {100 * (1 - total_useful / total_running):.2f}% of your time.\n"
+                    f"and their {n_useful - len(useful_jobs)} parents) ran for: "
+                    f"[bold red]{fmt(totals['useful'])}[/].\n"
+                    f"Which means you wasted "
+                    f"{100 * (1 - totals['useful'] / totals['running']):.2f}% "
+                    "of your time.\n"
                 )
             if skipped:
                 print(
                     f"[italic white]This is an underestimation; {skipped} jobs "
-                    f"({int(skipped*100/len(jobs))}%) were skipped due to missing metadata.[/]"
+                    f"({int(skipped*100/len(df))}%) were skipped due to missing metadata.[/]"
                 )
+
+    if output is not None:
+        df = pd.concat(tables, ignore_index=True)
+        summary = pd.concat(
+            [
+                summarize(df.assign(type="all"), ["project", "type"]),
+                summarize(df, ["project", "type"]),
+            ],
+            ignore_index=True,
+        ).sort_values("project", kind="stable")
+        output = Path(output)
+        if output.suffix == ".parquet":
+            summary.to_parquet(output, index=False)
+        else:
+            summary.to_csv(
+                output, sep="\t" if output.suffix == ".tsv" else ",", index=False
+            )
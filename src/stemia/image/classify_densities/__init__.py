@@ -0,0 +1,3 @@
+from .classify_densities import cli
+
+__all__ = ["cli"]
@@ -0,0 +1,185 @@
+import click
+
+
+@click.command()
+@click.argument(
+    "stacks", nargs=-1, type=click.Path(exists=True, dir_okay=False, resolve_path=True)
+)
+@click.option("-c", "--max-classes", default=5, type=int)
+@click.option(
+    "-b",
+    "--batch-size",
+    default=1000,
+    type=int,
+    help="number of images processed at once when computing features",
+)
+@click.option(
+    "-m",
+    "--method",
+    type=click.Choice(["hierarchical", "subsample", "kmeans"]),
+    default="hierarchical",
+    help="clustering backend. Full hierarchical clustering needs O(n^2) memory: "
+    "for large datasets, cluster a random subsample and assign all particles "
+    "to the nearest class centroid, or use k-means",
+)
+@click.option(
+    "-s",
+    "--sample-size",
+    default=10000,
+    type=int,
+    help="number of particles used for linkage with the subsample method",
+)
+@click.option("--seed", default=0, type=int, help="random seed for clustering")
+@click.option(
+    "--virtual",
+    is_flag=True,
+    help="do not write class stacks; write a star file per class referencing "
+    "the input images as index@path instead",
+)
+@click.option(
+    "-j", "--jobs", default=4, type=int, help="number of class stacks written at once"
+)
+def cli(stacks, max_classes, batch_size, method, sample_size, seed, virtual, jobs):
+    """Do hierarchical classification of particle stacks based on densities."""
+    from concurrent.futures import ThreadPoolExecutor
+    from contextlib import ExitStack
+    from pathlib import Path
+
+    import mrcfile
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    from matplotlib import pyplot as plt
+    from rich import print
+    from rich.progress import Progress
+    from scipy.cluster.hierarchy import dendrogram
+
+    from stemia.utils.image_processing import compute_dist_field, create_mask_from_field
+
+    from .funcs import (
+        cluster_hierarchical,
+        cluster_kmeans,
+        density_features,
+        write_class_stack,
+    )
+
+    if not stacks:
+        return
+
+    with mrcfile.open(stacks[0], header_only=True) as mrc:
+        shape = mrc.header[["nx", "ny"]].item()
+
+    radius = min(shape) / 2
+    dist_field = compute_dist_field(
+        shape=shape,
+        field_type="sphere",
+    )
+    mask = create_mask_from_field(
+        field=dist_field,
+        radius=radius * 0.6,
+        padding=radius * 0.8,
+    )
+
+    field_squared = dist_field**2
+
+    images = []
+    stack_ids = []
+    names = []
+    feature_batches = []
+
+    print(f"Running with {max_classes} classes.")
+
+    with Progress() as progress, ExitStack() as open_files:
+        for st in progress.track(stacks, description="Reading data..."):
+            # memory map so only the current batch of images is ever loaded
+            data = open_files.enter_context(mrcfile.mmap(st, mode="r")).data
+            if data.ndim == 2:
+                data = data[np.newaxis]
+            images.append(data)
+            stack_ids.append(np.full(len(data), len(images) - 1))
+            names.extend(f"{Path(st).stem}_{idx}" for idx in range(len(data)))
+            for start in progress.track(
+                range(0, len(data), batch_size), description="Calculating features..."
+            ):
+                feature_batches.append(
+                    density_features(
+                        data[start : start + batch_size], mask, field_squared
+                    )
+                )
+            progress.update(progress.task_ids[-1], visible=False)
+
+        df = pd.DataFrame(
+            np.concatenate(feature_batches),
+            columns=["total_density", "radius_of_gyration"],
+            index=pd.Index(names, name="image"),
+        )
+
+        proc_task = progress.add_task("Classifying...", total=3)
+
+        Z = None
+        features = df.to_numpy()
+        if method == "kmeans":
+            classes = cluster_kmeans(features, max_classes, seed=seed)
+        else:
+            classes, Z = cluster_hierarchical(
+                features,
+                max_classes,
+                sample_size=sample_size if method == "subsample" else None,
+                seed=seed,
+            )
+        progress.update(proc_task, advance=2)
+        df["class"] = classes
+        stack_ids = np.concatenate(stack_ids)
+        slice_ids = np.concatenate([np.arange(len(data)) for data in images])
+
+        if Z is not None:
+            fig = plt.figure(figsize=(50, 20))
+            _ = dendrogram(Z)
+            plt.savefig("classification.png")
+        df.to_csv("classification.csv", sep="\t")
+        df["name"] = df.index
+
+        fig = px.scatter(
+            df,
+            x="total_density",
+            y="radius_of_gyration",
+            color="class",
+            hover_name="name",
+        )
+        fig.show()
+        progress.update(proc_task, advance=1)
+
+        if virtual:
+            import starfile
+
+            for cl in progress.track(
+                np.unique(classes), description="Writing class star files..."
+            ):
+                in_class = classes == cl
+                image_names = [
+                    f"{idx + 1:06}@{stacks[st]}"
+                    for st, idx in zip(stack_ids[in_class], slice_ids[in_class])
+                ]
+                starfile.write(
+                    pd.DataFrame({"rlnImageName": image_names}),
+                    f"class_{cl:04}.star",
+                    overwrite=True,
+                )
+            return
+
+        to_write = []
+        for cl in np.unique(classes):
+            in_class = classes == cl
+            for st in np.unique(stack_ids[in_class]):
+                indices = slice_ids[in_class & (stack_ids == st)]
+                output = f"{Path(stacks[st]).stem}_class_{cl:04}.mrc"
+                to_write.append((images[st], indices, output))
+
+        # gather images straight from the memory maps into the outputs
+        with ThreadPoolExecutor(jobs) as pool:
+            futures = [
+                pool.submit(write_class_stack, *args, batch_size=batch_size)
+                for args in to_write
+            ]
+            for fut in progress.track(futures, description="Splitting classes..."):
+                fut.result()
@@ -0,0 +1,84 @@
+import numpy as np
+
+
+def density_features(imgs, mask, field_squared):
+    """
+    Compute total density and radius of gyration for a batch of images.
+
+    Each image is normalised by subtracting its minimum and dividing by its mean,
+    then weighted by the mask. Normalisation is applied to the weighted sums rather
+    than to the pixels, so the input (e.g. a memory map) is never modified.
+
+    Returns an (n, 2) array of total density and radius of gyration.
+    """
+    imgs = np.asarray(imgs, dtype=np.float32)
+    weights = np.stack([mask, mask * field_squared]).astype(np.float32)
+    mins = imgs.min(axis=(1, 2))
+    means = imgs.mean(axis=(1, 2), dtype=np.float64) - mins
+    sums = np.tensordot(imgs, weights, axes=((1, 2), (1, 2)))
+    features = (sums - mins[:, None] * weights.sum(axis=(1, 2))) / means[:, None]
+    features[:, 1] = np.sqrt(features[:, 1])
+    return features
+
+
+def assign_to_centroids(features, centroids):
+    """Return the index of the nearest centroid for each feature vector."""
+    dists = ((features[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=-1)
+    return dists.argmin(axis=1)
+
+
+def cluster_hierarchical(features, max_classes, sample_size=None, seed=0):
+    """
+    Hierarchical centroid clustering, optionally on a random subsample.
+
+    Linkage needs O(n^2) memory and time; when subsampling, the linkage is only
+    computed on `sample_size` random particles and every particle is then assigned
+    to the nearest class centroid. Optimal leaf ordering only affects the dendrogram
+    and is too expensive for large samples, so it is skipped in this case.
+
+    Returns the (1-based, fcluster-like) class of each particle and the linkage.
+    """
+    from scipy.cluster.hierarchy import fcluster, linkage
+
+    if sample_size is None or sample_size >= len(features):
+        Z = linkage(features, "centroid", optimal_ordering=True)
+        return fcluster(Z, t=max_classes, criterion="maxclust"), Z
+
+    rng = np.random.default_rng(seed)
+    sample = features[rng.choice(len(features), size=sample_size, replace=False)]
+    Z = linkage(sample, "centroid")
+    sample_classes = fcluster(Z, t=max_classes, criterion="maxclust")
+    labels = np.unique(sample_classes)
+    centroids = np.stack([sample[sample_classes == lb].mean(axis=0) for lb in labels])
+    return labels[assign_to_centroids(features, centroids)], Z
+
+
+def cluster_kmeans(features, max_classes, seed=0):
+    """
+    K-means clustering of the features.
+
+    Returns the (1-based, fcluster-like) class of each particle.
+    """
+    from scipy.cluster.vq import kmeans2
+
+    _, classes = kmeans2(features, max_classes, minit="++", seed=seed)
+    # drop empty clusters and start counting from 1 like fcluster
+    return np.unique(classes, return_inverse=True)[1] + 1
+
+
+def write_class_stack(images, indices, output, batch_size=1000):
+    """
+    Write the images at the given indices to a new mrc stack.
+
+    Images are copied batch by batch into a preallocated memory-mapped output,
+    so the stack is never held in memory as a whole.
+    """
+    import mrcfile
+    from mrcfile.utils import mode_from_dtype
+
+    shape = (len(indices), *images.shape[1:])
+    mode = mode_from_dtype(images.dtype)
+    with mrcfile.new_mmap(output, shape=shape, mrc_mode=mode, overwrite=True) as mrc:
+        for start in range(0, len(indices), batch_size):
+            batch = indices[start : start + batch_size]
+            mrc.data[start : start + len(batch)] = images[batch]
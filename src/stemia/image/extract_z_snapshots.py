@@ -1,10 +1,106 @@
 import click
 
 
+def _slice_indices(n, n_slices, keep_extrema, rng):
+    """Indices of equidistant slices along an axis of length n."""
+    steps = range(1 - int(keep_extrema), n_slices + 1 + int(keep_extrema))
+    if rng is not None:
+        start, end = (int(sl) for sl in rng.split(","))
+        step_size = (end - start) / (n_slices + 1)
+    else:
+        start = 0
+        step_size = n / (n_slices + 1)
+    # the last extremum would fall just outside of the volume
+    return [min(start + int(i * step_size), n - 1) for i in steps]
+
+
+def _render_snapshots(
+    path, output_dir, n_slices, keep_extrema, rng, average, axis, size, fmt, mrc
+):
+    """
+    Render slices of a volume to images without a viewer.
+
+    Only the slabs needed for each (averaged) slice are read from the memory-mapped
+    volume. Contrast limits are the same for all slices of a volume, and are taken
+    from percentiles of a random subsample of the averaged slices.
+
+    If path is a multiscale zarr pyramid (see `stemia image pyramid`), slices are
+    read from the coarsest level that is at least as large as the output size.
+    """
+    from contextlib import ExitStack
+    from pathlib import Path
+
+    import mrcfile
+    import numpy as np
+    from PIL import Image
+
+    path = Path(path)
+    with ExitStack() as files:
+        if path.is_dir():
+            from ..utils.io_ import read_pyramid_level
+
+            min_shape = None
+            if size is not None:
+                # size is (x, y) of the image, which are the remaining axes in order
+                min_shape = [0, 0, 0]
+                other_axes = [ax for ax in range(3) if ax != axis]
+                min_shape[other_axes[0]], min_shape[other_axes[1]] = size[::-1]
+            data, voxel_size, factor = read_pyramid_level(path, min_shape)
+            pixel_size = tuple(voxel_size[::-1])
+            factor = round(factor[axis])
+        else:
+            mrc_in = files.enter_context(mrcfile.mmap(path, mode="r", permissive=True))
+            data = mrc_in.data
+            pixel_size = mrc_in.voxel_size.item()
+            factor = 1
+
+        def read_planes(lo, hi):
+            slab = tuple(
+                slice(lo, hi) if ax == axis else slice(None) for ax in range(3)
+            )
+            return np.moveaxis(np.asarray(data[slab]), axis, 0)
+
+        # indices and averaging are given in full resolution planes
+        n_planes = data.shape[axis]
+        indices = _slice_indices(n_planes * factor, n_slices, keep_extrema, rng)
+        n_average = max(1, round(average / factor))
+        plane_shape = [n for ax, n in enumerate(data.shape) if ax != axis]
+        slices = []
+        for idx in indices:
+            # same window as a centered moving average, truncated at the edges
+            center = min(idx // factor, n_planes - 1)
+            lo = max(0, center - n_average // 2)
+            hi = min(n_planes, center - n_average // 2 + n_average)
+            acc = np.zeros(plane_shape, dtype=np.float32)
+            for plane in read_planes(lo, hi):
+                acc += plane
+            slices.append(acc / (hi - lo))
+
+    stack = np.stack(slices)
+    sample = np.random.default_rng(0).choice(
+        stack.ravel(), size=min(stack.size, 1_000_000), replace=False
+    )
+    vmin, vmax = np.percentile(sample, (0.5, 99.5))
+    output_size = tuple(size) if size is not None else stack.shape[:0:-1]
+
+    written = []
+    for idx, sl in zip(indices, stack):
+        normed = (sl - vmin) / max(vmax - vmin, np.finfo(np.float32).eps)
+        snapshot = Image.fromarray((np.clip(normed, 0, 1) * 255).astype(np.uint8))
+        if snapshot.size != output_size:
+            snapshot = snapshot.resize(output_size, Image.Resampling.LANCZOS)
+        save_as = Path(output_dir) / (path.stem + f"_slice_{idx:03}.{fmt}")
+        snapshot.save(save_as)
+        written.append(save_as)
+
+        if mrc:
+            with mrcfile.new(save_as.with_suffix(".mrc"), sl, overwrite=True) as mrc_f:
+                mrc_f.voxel_size = pixel_size
+    return written
+
+
 @click.command()
-@click.argument(
-    "inputs", nargs=-1, type=click.Path(exists=True, dir_okay=False, resolve_path=True)
-)
+@click.argument("inputs", nargs=-1, type=click.Path(exists=True, resolve_path=True))
 @click.option(
     "-o",
     "--output-dir",
@@ -41,32 +137,95 @@ import click
     help="range of slices to image (A,B)",
 )
 @click.option("--axis", default=0, type=int, help="axis along which to do the slicing")
-def cli(inputs, output_dir, mrc, keep_extrema, n_slices, average, axis, size, rng):
+@click.option(
+    "--headless",
+    is_flag=True,
+    help="render images directly from mrc files, without opening a viewer",
+)
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["png", "jpg"]),
+    default="png",
+    help="image format (headless only)",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    default=4,
+    type=int,
+    help="number of volumes processed in parallel (headless only)",
+)
+def cli(
+    inputs,
+    output_dir,
+    mrc,
+    keep_extrema,
+    n_slices,
+    average,
+    axis,
+    size,
+    rng,
+    headless,
+    fmt,
+    jobs,
+):
     """
     Grab z slices at regular intervals from a tomogram as jpg images.
 
-    INPUTS: any number of paths of volume images
+    INPUTS: any number of paths of volume images (or zarr pyramids, if headless)
+
+    By default, slices are rendered with napari screenshots. With --headless, only
+    the needed slices are read and rendered directly, which does not need a display.
     """
     if not inputs:
         return
 
     from pathlib import Path
 
+    from rich.progress import Progress
+
+    out = Path(output_dir)
+    if size is not None:
+        size = [int(s) for s in size.split(",")]
+
+    if headless:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        out.mkdir(parents=True, exist_ok=True)
+        with ProcessPoolExecutor(jobs) as pool, Progress() as progress:
+            futures = [
+                pool.submit(
+                    _render_snapshots,
+                    inp,
+                    out,
+                    n_slices=n_slices,
+                    keep_extrema=keep_extrema,
+                    rng=rng,
+                    average=average,
+                    axis=axis,
+                    size=size,
+                    fmt=fmt,
+                    mrc=mrc,
+                )
+                for inp in inputs
+            ]
+            for fut in progress.track(
+                as_completed(futures), total=len(futures), description="Rendering..."
+            ):
+                fut.result()
+        return
+
     import cryohub
     import napari
     import numpy as np
     from cryotypes.image import ImageProtocol
-    from rich.progress import Progress
     from scipy.ndimage import convolve
 
-    out = Path(output_dir)
     images = [i for i in cryohub.read(*inputs) if isinstance(i, ImageProtocol)]
     if not images:
         return
 
-    if size is not None:
-        size = [int(s) for s in size.split(",")]
-
     out.mkdir(parents=True, exist_ok=True)
     v = napari.Viewer()
     with Progress() as progress:
@@ -78,22 +237,14 @@ def cli(inputs, output_dir, mrc, keep_extrema, n_slices, average, axis, size, rn
 
             v.add_image(img, interpolation2d="spline36")
 
-            if size is None:
-                output_size = img.shape[1:]
+            output_size = img.shape[1:] if size is None else size
 
             v.window._qt_viewer.canvas.size = output_size
             v.reset_view()
             v.camera.zoom *= 1.2
 
-            steps = list(range(1 - int(keep_extrema), n_slices + 1 + int(keep_extrema)))
-            if rng is not None:
-                start, end = (int(sl) for sl in rng.split(","))
-                step_size = (end - start) / (n_slices + 1)
-            else:
-                start = 0
-                step_size = len(img) / (n_slices + 1)
-            for i in progress.track(steps, description="Generating slices"):
-                idx = start + int(i * step_size)
+            indices = _slice_indices(len(img), n_slices, keep_extrema, rng)
+            for idx in progress.track(indices, description="Generating slices"):
                 v.dims.set_current_step(0, idx)
 
                 save_as = out / (image.source.stem + f"_slice_{idx:03}.png")
@@ -2,78 +2,177 @@ import click
 
 
 @click.command()
-@click.argument("star_path", type=click.Path(exists=True, dir_okay=False))
-@click.option("-o", "--output", type=click.Path(dir_okay=False, writable=True))
+@click.argument(
+    "star_paths", nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False)
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="output star file (only with a single input) [default: *_z_flipped.star]",
+)
 @click.option("-m", "--mrc_path", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-t",
+    "--tomo_dir",
+    type=click.Path(exists=True, file_okay=False),
+    help="directory with the tomograms. Shapes and pixel sizes are read from each "
+    "header and matched to particles by rlnTomoName or rlnMicrographName",
+)
 @click.option("--star_pixel_size", type=float)
 @click.option("--mrc_pixel_size", type=float)
 @click.option("--z_shape", type=int)
+@click.option(
+    "-j", "--jobs", type=int, default=16, help="number of mrc headers read at once"
+)
 def cli(
-    star_path,
+    star_paths,
     *,
     output=None,
     mrc_path=None,
+    tomo_dir=None,
     star_pixel_size=None,
     mrc_pixel_size=None,
     z_shape=None,
+    jobs=16,
 ):
     """
-    Flip the z axis for particles in a RELION star file.
+    Flip the z axis for particles in RELION star files.
 
-    STAR_PATH: star file to flip along z
+    STAR_PATHS: star files to flip along z
 
-    Assumes all tomograms have the same shape.
+    All data blocks with particle coordinates are flipped. With --tomo_dir, each
+    particle is flipped according to the shape of its own tomogram; otherwise,
+    assumes all tomograms have the same shape.
     """
+    from concurrent.futures import ThreadPoolExecutor
     from pathlib import Path
 
-    import eulerangles
     import mrcfile
+    import numpy as np
+    import pandas as pd
     import starfile
+    from rich.progress import Progress
 
-    if mrc_path is None:
+    if tomo_dir is None and mrc_path is None:
         if mrc_pixel_size is None or z_shape is None:
             raise click.UsageError(
-                "must provide either mrc_path or both mrc_pixel_size and z_shape"
+                "must provide either tomo_dir, mrc_path or both mrc_pixel_size "
+                "and z_shape"
             )
-    if output is None:
-        sp = Path(star_path)
-        output = sp.parent / (sp.stem + "_z_flipped.star")
-    star = starfile.open(star_path, always_dict=True)
+    if output is not None and len(star_paths) > 1:
+        raise click.UsageError("--output can only be used with a single star file")
+
     euler_headers = [f"rlnAngle{angle}" for angle in ("Rot", "Tilt", "Psi")]
     z_header = "rlnCoordinateZ"
-    pixel_size_headers = ["rlnImagePixelSize", "rlnDetectorPixelSize"]
+    pixel_size_headers = [
+        "rlnImagePixelSize",
+        "rlnDetectorPixelSize",
+        "rlnTomoTiltSeriesPixelSize",
+    ]
+    tomo_name_headers = ["rlnTomoName", "rlnMicrographName"]
+
+    def read_header(path):
+        with mrcfile.open(path, header_only=True, permissive=True) as mrc:
+            return path.stem, mrc.header.nz.item(), mrc.voxel_size.item()[0]
+
+    # one row per tomogram, indexed by name
+    if tomo_dir is not None:
+        tomos = [
+            p
+            for p in sorted(Path(tomo_dir).iterdir())
+            if p.suffix in (".mrc", ".rec", ".st")
+        ]
+        if not tomos:
+            raise click.UsageError(f"no tomograms found in {tomo_dir}")
+        with ThreadPoolExecutor(jobs) as pool:
+            tomo_table = pd.DataFrame(
+                list(pool.map(read_header, tomos)),
+                columns=["name", "z_shape", "pixel_size"],
+            ).set_index("name")
+    elif mrc_path is not None:
+        _, nz, px = read_header(Path(mrc_path))
+        z_shape = z_shape or nz
+        mrc_pixel_size = mrc_pixel_size or px
 
-    for _block_name, df in star.items():
-        if euler_headers[0] in df.columns:
-            # keep these
-            break
+    if tomo_dir is not None:
+        # explicit values take precedence over headers, like with mrc_path
+        if z_shape is not None:
+            tomo_table["z_shape"] = z_shape
+        if mrc_pixel_size is not None:
+            tomo_table["pixel_size"] = mrc_pixel_size
 
-    if star_pixel_size is None:
+    def get_star_pixel_size(star, df):
+        if star_pixel_size is not None:
+            return star_pixel_size
         for h in pixel_size_headers:
             if h in df.columns:
-                star_pixel_size = df[h]
+                return df[h].to_numpy()
+        # RELION 3.1+ keeps the pixel size in the optics block
+        optics = star.get("optics")
+        if optics is not None and "rlnOpticsGroup" in df.columns:
+            for h in pixel_size_headers:
+                if h in optics.columns:
+                    return (
+                        df["rlnOpticsGroup"]
+                        .map(optics.set_index("rlnOpticsGroup")[h])
+                        .to_numpy()
+                    )
+        raise click.UsageError("could not find pixel size in star file")
+
+    def get_tomo_info(df):
+        if tomo_dir is None:
+            return z_shape, mrc_pixel_size
+        for h in tomo_name_headers:
+            if h in df.columns:
+                names = df[h].astype(str)
                 break
         else:
-            raise ValueError("could not find pixel size in star file")
-    if mrc_path is not None:
-        with mrcfile.open(mrc_path, header_only=True) as mrc:
-            z_shape = z_shape or mrc.header.nz.item()
-            mrc_pixel_size = mrc_pixel_size or mrc.voxel_size.item()[0]
-    normalized_z_shape = z_shape * (mrc_pixel_size / star_pixel_size)
-
-    def flip_positions(z_values, z_shape):
-        return z_shape - z_values
+            raise click.UsageError(
+                f"star file needs one of {tomo_name_headers} to match tomograms"
+            )
+        # compare by stem, so full paths and extensions are ignored
+        stems = names.map(lambda name: Path(name).stem)
+        missing = set(stems.unique()).difference(tomo_table.index)
+        if missing:
+            raise click.UsageError(
+                f"could not find tomograms in {tomo_dir} for: {', '.join(missing)}"
+            )
+        info = tomo_table.loc[stems]
+        return info["z_shape"].to_numpy(), info["pixel_size"].to_numpy()
 
     def flip_eulers(angles):
-        mat = eulerangles.euler2matrix(
-            angles, axes="zyz", intrinsic=True, right_handed_rotation=True
-        )
-        mat[:, :, -1] *= -1
-        flipped = eulerangles.matrix2euler(
-            mat, axes="zyz", intrinsic=True, right_handed_rotation=True
-        )
-        return flipped
+        # equivalent to multiplying the last column of the rotation matrix by -1
+        # and converting back to zyz intrinsic euler angles (eulerangles)
+        rot, tilt, psi = np.asarray(angles, dtype=float).T
+        # bring tilt in [0, 180] first; (rot, -tilt, psi) == (rot+180, tilt, psi+180)
+        tilt = tilt % 360
+        negative = tilt > 180
+        tilt = np.where(negative, 360 - tilt, tilt)
+        rot = rot + 180 * negative
+        psi = psi + 180 * negative
+        return np.stack([rot % 360 - 180, 180 - tilt, (psi + 180) % 360 - 180], axis=1)
+
+    with Progress() as progress:
+        for star_path in progress.track(star_paths, description="Flipping..."):
+            star = starfile.read(star_path, always_dict=True)
+            flipped_blocks = 0
+            for df in star.values():
+                if z_header not in df.columns:
+                    continue
+                z_shapes, mrc_pixel_sizes = get_tomo_info(df)
+                star_px = get_star_pixel_size(star, df)
+                normalized_z_shape = z_shapes * (mrc_pixel_sizes / star_px)
+                df[z_header] = normalized_z_shape - df[z_header]
+                if euler_headers[0] in df.columns:
+                    df[euler_headers] = flip_eulers(df[euler_headers])
+                flipped_blocks += 1
+            if not flipped_blocks:
+                raise click.UsageError(f"no particle coordinates found in {star_path}")
 
-    df[z_header] = flip_positions(df[z_header], normalized_z_shape)
-    df[euler_headers] = flip_eulers(df[euler_headers])
-    starfile.write(star, output)
+            if output is None:
+                sp = Path(star_path)
+                out = sp.parent / (sp.stem + "_z_flipped.star")
+            else:
+                out = output
+            starfile.write(star, out)
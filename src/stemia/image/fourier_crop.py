@@ -5,35 +5,119 @@ import click
 @click.argument(
     "inputs", nargs=-1, type=click.Path(exists=True, dir_okay=False, resolve_path=True)
 )
-@click.option("-b", "--binning", type=float, help="binning amount", required=True)
+@click.option(
+    "-b",
+    "--binning",
+    type=float,
+    help="binning amount. Values below 1 upsample by fourier padding",
+    required=True,
+)
+@click.option(
+    "--stack/--volume",
+    default=None,
+    help="treat inputs as 2D image stacks or as volumes [default: stacks for .mrcs "
+    "files, volumes otherwise]",
+)
+@click.option(
+    "-c",
+    "--chunk-size",
+    type=int,
+    default=256,
+    help="number of images processed at once in stack mode",
+)
+@click.option(
+    "--out-of-core",
+    is_flag=True,
+    help="bin volumes in slabs, for volumes that do not fit in memory",
+)
+@click.option(
+    "-s",
+    "--slab-size",
+    type=int,
+    default=32,
+    help="number of planes processed at once with --out-of-core",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=-1,
+    help="number of threads used for the fourier transforms (-1 for all cores)",
+)
 @click.option("-f", "--overwrite", is_flag=True, help="overwrite output if exists")
-def cli(inputs, binning, overwrite):
-    """Bin mrc images to the specified pixel size using fourier cropping."""
+def cli(inputs, binning, stack, chunk_size, out_of_core, slab_size, workers, overwrite):
+    """
+    Bin mrc images to the specified pixel size using fourier cropping.
+
+    Image stacks (e.g: particles) are binned image by image, streaming through
+    the input in chunks.
+    """
+    from functools import partial
     from pathlib import Path
 
     import mrcfile
     import numpy as np
-    from rich.progress import track
-    from scipy.fft import fftn, fftshift, ifftn, ifftshift
-
-    for inp in track(inputs, description="Cropping..."):
-        inp = Path(inp)
-        output = inp.with_stem(inp.stem + f"_bin{binning}")
-        if Path(output).is_file() and not overwrite:
-            raise click.UsageError(f'{output} exists but "-f" flag was not passed')
-
-        with mrcfile.open(str(input)) as mrc:
-            px_size = mrc.voxel_size.x
-            data = mrc.data
-
-        ft = fftshift(fftn(data))
-        center = np.array(data.shape) // 2
-        shifts_from_center = (np.array(data.shape) // (binning * 2)).astype(int)
-        crop_slice = tuple(
-            slice(c - s, c + s) for c, s in zip(center, shifts_from_center)
-        )
-        ft_cropped = ft[crop_slice]
-        cropped = ifftn(ifftshift(ft_cropped)).real
-
-        with mrcfile.new(output, cropped, overwrite=overwrite) as mrc:
-            mrc.voxel_size = px_size * binning
+    from rich.progress import Progress
+
+    from ..utils.image_processing import fourier_resample, fourier_resample_slabs
+    from ..utils.io_ import map_mrc_stack
+
+    with Progress() as progress:
+        for inp in progress.track(inputs, description="Cropping..."):
+            inp = Path(inp)
+            output = inp.with_stem(inp.stem + f"_bin{binning}")
+            if Path(output).is_file() and not overwrite:
+                raise click.UsageError(f'{output} exists but "-f" flag was not passed')
+
+            with mrcfile.mmap(inp, mode="r") as mrc:
+                px_size = np.array(mrc.voxel_size.item())
+                shape = mrc.data.shape
+                # the mrc header is not reliable: many tomograms have ispg=0
+                is_stack = inp.suffix == ".mrcs" if stack is None else stack
+                # stacks are only binned along the image axes
+                axes = range(1, len(shape)) if is_stack else range(len(shape))
+                new_shape = tuple(
+                    2 * int(s // (binning * 2)) if ax in axes else s
+                    for ax, s in enumerate(shape)
+                )
+                if not is_stack and not out_of_core:
+                    cropped = fourier_resample(mrc.data, new_shape, workers=workers)
+
+            # shapes are rounded, so compute the exact pixel size (xyz order)
+            scale = np.ones(3)
+            scale[: len(shape)] = np.divide(shape, new_shape)[::-1]
+            voxel_size = tuple(px_size * scale)
+
+            if is_stack:
+                # stack z size is meaningless, mrc convention is to use the x size
+                voxel_size = (*voxel_size[:2], voxel_size[0])
+                map_mrc_stack(
+                    partial(
+                        fourier_resample,
+                        shape=new_shape[1:],
+                        axes=(1, 2),
+                        workers=workers,
+                    ),
+                    inp,
+                    output,
+                    shape=new_shape,
+                    chunk_size=chunk_size,
+                    voxel_size=voxel_size,
+                    overwrite=overwrite,
+                    progress=progress,
+                )
+            elif out_of_core:
+                with mrcfile.mmap(inp, mode="r") as mrc, mrcfile.new_mmap(
+                    output, new_shape, mrc_mode=2, overwrite=overwrite
+                ) as new:
+                    new.voxel_size = voxel_size
+                    fourier_resample_slabs(
+                        mrc.data,
+                        new.data,
+                        slab_size=slab_size,
+                        workers=workers,
+                        tmp_dir=output.parent,
+                    )
+            else:
+                with mrcfile.new(output, cropped, overwrite=overwrite) as mrc:
+                    mrc.voxel_size = voxel_size
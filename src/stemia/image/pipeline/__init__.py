@@ -0,0 +1,3 @@
+from .pipeline import cli
+
+__all__ = ["cli"]
@@ -0,0 +1,194 @@
+import numpy as np
+
+# stages that are applied in fourier space and fused into a single resampling
+FOURIER_STAGES = ("bin", "rescale", "lowpass")
+FLIP_AXES = {"z": -3, "y": -2, "x": -1}
+
+
+def _parse_box(arg):
+    return tuple(int(n) for n in arg.split(","))
+
+
+def _parse_flip(arg):
+    if arg not in FLIP_AXES:
+        raise ValueError(f"flip axis must be one of {', '.join(FLIP_AXES)}")
+    return arg
+
+
+STAGES = {
+    "bin": float,
+    "rescale": float,
+    "lowpass": float,
+    "box": _parse_box,
+    "mask": str,
+    "normalise": None,
+    "flip": _parse_flip,
+}
+
+
+def parse_stage(stage):
+    """Parse a stage string in the form `name[:argument]`."""
+    name, _, arg = stage.partition(":")
+    name = name.strip().lower().replace("normalize", "normalise")
+    if name not in STAGES:
+        raise ValueError(f"unknown stage {name!r}, must be one of {', '.join(STAGES)}")
+    parser = STAGES[name]
+    if parser is None:
+        if arg:
+            raise ValueError(f"stage {name!r} takes no argument")
+        return name, None
+    if not arg:
+        raise ValueError(f"stage {name!r} requires an argument ({name}:VALUE)")
+    return name, parser(arg)
+
+
+def _fourier_step(in_shape, in_px, shape, px, limits, stages):
+    """Build a fused fourier step, given the input and target shape and pixel size."""
+    # pixel size actually obtained by fourier resampling to an integer shape
+    px_fourier = in_px * np.divide(in_shape, shape)
+    # the final crop already limits resolution to its nyquist; only stricter limits
+    # from lowpass stages or intermediate binning need an explicit filter
+    lowpass_res = max(limits, default=0)
+    if lowpass_res <= 2 * px_fourier.min() * (1 + 1e-6):
+        lowpass_res = None
+    scale = px / px_fourier
+    return {
+        "op": "fourier",
+        "stages": stages,
+        "shape": shape,
+        # cutoff in cycles per input pixel, per axis for anisotropic pixel sizes
+        "lowpass": None if lowpass_res is None else in_px / lowpass_res,
+        "lowpass_res": lowpass_res,
+        "scale": None if np.allclose(scale, 1) else scale,
+    }
+
+
+def plan_pipeline(stages, shape, px_size):
+    """
+    Turn a list of parsed stages into a list of steps to execute.
+
+    Consecutive bin, rescale and lowpass stages are fused in a single fourier
+    resampling (plus a spline correction if the rounding of the shape changes the
+    pixel size), band-limited by the strictest of the lowpass stages and the
+    nyquist frequencies of intermediate pixel sizes.
+
+    shape, px_size: input shape and pixel size per axis (zyx)
+    Returns the list of steps, the output shape and the output pixel size.
+    """
+    shape = tuple(shape)
+    px = np.asarray(px_size, dtype=float)
+    steps = []
+    fused = None
+    for name, arg in stages:
+        if name in FOURIER_STAGES:
+            if fused is None:
+                fused = {"in_shape": shape, "in_px": px, "limits": [], "stages": []}
+            fused["stages"].append(f"{name}:{arg:g}")
+            if name == "lowpass":
+                fused["limits"].append(arg)
+                continue
+            if name == "bin":
+                new_shape = tuple(2 * int(s // (arg * 2)) for s in shape)
+                px = px * np.divide(shape, new_shape)
+            else:
+                new_shape = tuple(round(s * p / arg) for s, p in zip(shape, px))
+                px = np.full(len(shape), arg)
+            shape = new_shape
+            fused["limits"].append(2 * px.max())
+            continue
+
+        if fused is not None:
+            steps.append(_fourier_step(shape=shape, px=px, **fused))
+            fused = None
+
+        if name == "box":
+            if len(arg) == 1:
+                arg = arg * len(shape)
+            if len(arg) != len(shape):
+                raise ValueError(f"box size {arg} does not match image shape {shape}")
+            shape = arg
+            steps.append({"op": "box", "shape": shape})
+        elif name == "mask":
+            import mrcfile
+
+            with mrcfile.open(arg, header_only=True, permissive=True) as mrc:
+                mask_shape = tuple(mrc.header[["nz", "ny", "nx"]].item())
+            if (
+                mask_shape[-len(shape) :] != shape
+                or np.prod(mask_shape[: -len(shape)]) != 1
+            ):
+                raise ValueError(
+                    f"mask {arg} has shape {mask_shape}, but the image at this stage "
+                    f"has shape {shape}"
+                )
+            steps.append({"op": "mask", "path": arg})
+        elif name == "normalise":
+            steps.append({"op": "normalise"})
+        elif name == "flip":
+            if -FLIP_AXES[arg] > len(shape):
+                raise ValueError(f"cannot flip {arg} for image with shape {shape}")
+            steps.append({"op": "flip", "axis": arg})
+
+    if fused is not None:
+        steps.append(_fourier_step(shape=shape, px=px, **fused))
+    return steps, shape, px
+
+
+def describe_step(step):
+    """Short description of a step, used for mrc header labels."""
+    op = step["op"]
+    if op == "fourier":
+        desc = (
+            f"fourier {' '.join(step['stages'])} -> {'x'.join(map(str, step['shape']))}"
+        )
+        if step["lowpass_res"] is not None:
+            desc += f" lp {step['lowpass_res']:.2f}A"
+        if step["scale"] is not None:
+            desc += " +spline"
+        return desc
+    if op == "box":
+        return f"box {'x'.join(map(str, step['shape']))}"
+    if op == "mask":
+        return f"mask {step['path']}"
+    if op == "flip":
+        return f"flip {step['axis']}"
+    return op
+
+
+def apply_step(img, step, workers=None):
+    """
+    Apply a single step of the pipeline to an image.
+
+    The input is never modified, so it can be a read-only memory map.
+    """
+    from stemia.utils.image_processing import (
+        fourier_resample,
+        resize_center,
+        zoom_chunked,
+    )
+
+    op = step["op"]
+    if op == "fourier":
+        fft_workers = -1 if workers is None else workers
+        img = fourier_resample(
+            img, step["shape"], workers=fft_workers, lowpass=step["lowpass"]
+        )
+        if step["scale"] is not None:
+            out = np.empty_like(img)
+            img = zoom_chunked(img, out, step["scale"], workers=workers)
+        return img
+    if op == "box":
+        img = np.asarray(img, dtype=np.float32)
+        return resize_center(img, step["shape"], fill=img.mean())
+    if op == "mask":
+        import mrcfile
+
+        with mrcfile.open(step["path"], permissive=True) as mrc:
+            mask = mrc.data.reshape(img.shape)
+            return np.multiply(img, mask, dtype=np.float32)
+    if op == "normalise":
+        img = np.asarray(img, dtype=np.float32)
+        return (img - img.mean()) / img.std()
+    if op == "flip":
+        return np.flip(img, axis=FLIP_AXES[step["axis"]])
+    raise ValueError(f"unknown step {op}")
@@ -0,0 +1,107 @@
+import click
+
+
+def _parse_stages(ctx, param, value):
+    from .funcs import parse_stage
+
+    try:
+        return [parse_stage(stage) for stage in value]
+    except ValueError as e:
+        raise click.BadParameter(str(e)) from None
+
+
+@click.command()
+@click.argument(
+    "input", type=click.Path(exists=True, dir_okay=False, resolve_path=True)
+)
+@click.argument("output", type=click.Path(dir_okay=False, resolve_path=True))
+@click.option(
+    "-s",
+    "--stage",
+    "stages",
+    multiple=True,
+    required=True,
+    callback=_parse_stages,
+    help="stage to apply, in order (can be passed multiple times). One of: "
+    "bin:FACTOR, rescale:PIXEL_SIZE, lowpass:RESOLUTION, box:SIZE or box:Z,Y,X, "
+    "mask:PATH, normalise, flip:z|y|x",
+)
+@click.option(
+    "--input-pixel-size",
+    type=float,
+    help="force input pizel size and ignore mrc header",
+)
+@click.option(
+    "-n",
+    "--dry-run",
+    is_flag=True,
+    help="only print the execution plan",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=None,
+    help="number of threads for fourier transforms and splines [default: all cores]",
+)
+@click.option("-f", "--overwrite", is_flag=True, help="overwrite output if exists")
+def cli(input, output, stages, input_pixel_size, dry_run, workers, overwrite):
+    """
+    Apply a chain of transformations to an mrc image in a single pass.
+
+    The input is read once and the output written once. Consecutive bin, rescale
+    and lowpass stages are fused into a single fourier resampling. The executed
+    plan is recorded in the output header labels.
+
+    Pixel sizes and resolutions are in Angstrom. Example:
+
+        stemia image pipeline in.mrc out.mrc -s rescale:1.2 -s box:256 -s lowpass:8
+    """
+    from pathlib import Path
+
+    import mrcfile
+    import numpy as np
+    from rich import print
+    from rich.progress import Progress
+
+    from .funcs import apply_step, describe_step, plan_pipeline
+
+    if Path(output).is_file() and not overwrite and not dry_run:
+        raise click.UsageError(f'{output} exists but "-f" flag was not passed')
+
+    with mrcfile.mmap(input, mode="r") as mrc:
+        voxel_size = np.array(mrc.voxel_size.item())
+        if input_pixel_size is not None:
+            voxel_size[:] = input_pixel_size
+        ndim = mrc.data.ndim
+        try:
+            steps, _, px = plan_pipeline(
+                stages, mrc.data.shape, voxel_size[::-1][-ndim:]
+            )
+        except ValueError as e:
+            raise click.UsageError(str(e)) from None
+
+        labels = [describe_step(step) for step in steps]
+        print("Execution plan:")
+        for i, label in enumerate(labels):
+            print(f"  {i + 1}. {label}")
+        if dry_run:
+            return
+
+        img = mrc.data
+        with Progress() as progress:
+            for step in progress.track(steps, description="Processing..."):
+                img = apply_step(img, step, workers=workers)
+        img = np.asarray(img, dtype=np.float32)
+
+    # pixel size is per axis in zyx, the header wants xyz
+    voxel_size[:ndim] = px[::-1]
+    with mrcfile.new(output, img, overwrite=overwrite) as new:
+        new.voxel_size = tuple(voxel_size)
+        # header only fits 10 labels of 80 characters (mrcfile already adds one)
+        free = 10 - int(new.header.nlabl)
+        labels = ["stemia pipeline", *labels]
+        if len(labels) > free:
+            labels = labels[: free - 1] + ["; ".join(labels[free - 1 :])]
+        for label in labels:
+            new.add_label(label[:80])
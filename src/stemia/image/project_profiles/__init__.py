@@ -0,0 +1,3 @@
+from .project_profiles import cli
+
+__all__ = ["cli"]
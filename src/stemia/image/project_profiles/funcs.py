@@ -0,0 +1,242 @@
+import warnings
+
+import numpy as np
+
+
+def normalize(arr):
+    """Normalize to the (0, 1) range, ignoring NaNs."""
+    arr = arr - np.nanmin(arr)
+    return arr / np.nanmax(arr)
+
+
+def project_volume(path, slab_size=32):
+    """
+    Average a volume along z, ignoring NaNs.
+
+    The volume is memory-mapped and accumulated slab by slab as a sum and a count
+    of valid voxels, so it never needs to fit in memory.
+
+    Returns the normalized projection and the pixel size.
+    """
+    import mrcfile
+
+    with mrcfile.mmap(path, mode="r", permissive=True) as mrc:
+        px_size = mrc.voxel_size.x.item()
+        data = mrc.data
+        total = np.zeros(data.shape[1:], dtype=np.float64)
+        count = np.zeros(data.shape[1:], dtype=np.int64)
+        for start in range(0, data.shape[0], slab_size):
+            slab = np.asarray(data[start : start + slab_size], dtype=np.float32)
+            valid = ~np.isnan(slab)
+            total += np.where(valid, slab, 0).sum(axis=0)
+            count += valid.sum(axis=0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (total / count).astype(np.float32)
+    return normalize(mean), px_size
+
+
+def split_chunks(proj, chunk_size):
+    """Split a projection in chunks along the first axis, fusing a small last one."""
+    chunks = np.split(proj, range(chunk_size, proj.shape[0], chunk_size), axis=0)
+    # fuse last two chunks if the last one is too small
+    if len(chunks) > 1 and chunks[-1].shape[0] < chunk_size / 2:
+        chunks = chunks[:-2] + [np.concatenate(chunks[-2:], axis=0)]
+    return chunks
+
+
+def chunk_scores(chunks):
+    """
+    Quality scores for the chunks of a projection.
+
+    nan_fraction: fraction of pixels outside of the re-extracted volume
+    contrast: standard deviation of the chunk's mean profile (a membrane gives a
+        strong dark/white modulation, noise or empty chunks average out)
+    """
+    import pandas as pd
+
+    nan_fraction = [np.isnan(chunk).mean() for chunk in chunks]
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "Mean of empty slice")
+        warnings.filterwarnings("ignore", "Degrees of freedom <= 0")
+        contrast = [np.nanstd(np.nanmean(chunk, axis=0)) for chunk in chunks]
+    df = pd.DataFrame({"nan_fraction": nan_fraction, "contrast": contrast})
+    df.index.name = "chunk"
+    return df
+
+
+def auto_select(scores, max_nan=0.2, min_contrast=0.5):
+    """
+    Select good chunks based on their scores.
+
+    Chunks are kept if they are mostly inside the volume and their contrast is at
+    least min_contrast times the median contrast of the volume.
+    """
+    contrast = scores["contrast"].fillna(0)
+    return (scores["nan_fraction"] <= max_nan) & (
+        contrast >= min_contrast * contrast.median()
+    )
+
+
+def save_projection(proj, path, px_size, overwrite=False):
+    """Save a projection as mrc and png (with the same stem)."""
+    import mrcfile
+    from PIL import Image
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", "Data array contains NaN values")
+        with mrcfile.new(path, proj, overwrite=overwrite) as mrc:
+            mrc.voxel_size = px_size
+    img = Image.fromarray((np.nan_to_num(proj) * 255).astype(np.uint8))
+    img.save(path.with_suffix(".png"))
+
+
+def prepare_volume(volume_path, outdir, chunk_size, overwrite=False):
+    """
+    Project a volume and split it in chunks, saving the full projection.
+
+    Returns the name, pixel size, chunks and chunk scores of the volume.
+    """
+    name = volume_path.stem
+    subdir = outdir / name
+    subdir.mkdir(parents=True, exist_ok=True)
+    full, px_size = project_volume(volume_path)
+    save_projection(full, subdir / f"{name}_projZ.mrc", px_size, overwrite=overwrite)
+
+    chunks = split_chunks(full, chunk_size)
+    scores = chunk_scores(chunks)
+    scores.to_csv(subdir / "chunk_scores.csv")
+    return name, px_size, chunks, scores
+
+
+def stack_profiles(profiles):
+    """
+    Stack 1D profiles of different lengths in a single NaN-padded 2D array.
+
+    Returns the 2D array and the length of each profile.
+    """
+    lengths = np.array([len(p) for p in profiles])
+    dtype = np.result_type(np.float32, *profiles)
+    stacked = np.full((len(profiles), lengths.max(initial=0)), np.nan, dtype=dtype)
+    valid = np.arange(stacked.shape[1]) < lengths[:, None]
+    stacked[valid] = np.concatenate(profiles) if profiles else []
+    return stacked, lengths
+
+
+def rolling_mean(profiles, window=5):
+    """
+    Trailing rolling mean along the rows, ignoring NaNs.
+
+    Same as pandas' rolling(window, min_periods=1).mean() on each row.
+    """
+    valid = ~np.isnan(profiles)
+    values = np.where(valid, profiles, 0).astype(np.float64)
+    total = np.zeros_like(values)
+    count = np.zeros(profiles.shape, dtype=int)
+    for shift in range(min(window, profiles.shape[1])):
+        total[:, shift:] += values[:, : values.shape[1] - shift]
+        count[:, shift:] += valid[:, : valid.shape[1] - shift]
+    with np.errstate(invalid="ignore"):
+        return np.where(count > 0, total / count, np.nan)
+
+
+def find_peaks_rows(profiles, lengths, height):
+    """
+    Find local maxima along the rows of a 2D array.
+
+    Same as scipy.signal.find_peaks(row[:length], height=height) on each row:
+    flat peaks are reported at their midpoint and NaNs are never peaks.
+
+    Returns a boolean array marking the peaks.
+    """
+    size = profiles.shape[1]
+    cols = np.arange(size)
+    # for each sample, index of the next sample with a different value, but
+    # never beyond the last sample of the row (like scipy's look ahead)
+    starts = np.ones(profiles.shape, dtype=bool)
+    starts[:, 1:] = ~(profiles[:, 1:] == profiles[:, :-1])
+    next_start = np.where(starts, cols, size)
+    next_start = np.minimum.accumulate(next_start[:, ::-1], axis=1)[:, ::-1]
+    ahead = np.full(profiles.shape, size)
+    ahead[:, :-1] = next_start[:, 1:]
+    ahead = np.minimum(ahead, lengths[:, None] - 1)
+
+    with np.errstate(invalid="ignore"):
+        rising = np.zeros(profiles.shape, dtype=bool)
+        rising[:, 1:] = profiles[:, :-1] < profiles[:, 1:]
+        after = np.take_along_axis(profiles, np.maximum(ahead, 0), axis=1)
+        falling = after < profiles
+    inside = (cols >= 1) & (cols < lengths[:, None] - 1)
+    left = rising & falling & inside
+
+    # peaks are at the middle of flat tops
+    peak_rows, left_cols = np.nonzero(left)
+    mid_cols = (left_cols + ahead[peak_rows, left_cols] - 1) // 2
+    peaks = np.zeros(profiles.shape, dtype=bool)
+    peaks[peak_rows, mid_cols] = True
+    with np.errstate(invalid="ignore"):
+        return peaks & (profiles >= height)
+
+
+def top_two_peaks(profiles, lengths, height):
+    """
+    Positions of the two highest peaks of each row (lowest first, like argsort).
+
+    Returns an (n, 2) array of positions and a mask of the rows with at least 2 peaks.
+    """
+    peaks = find_peaks_rows(profiles, lengths, height)
+    heights = np.where(peaks, profiles, -np.inf)
+    # stable sort: equal heights stay in order of position, like sorting each row
+    order = np.argsort(heights, axis=1, kind="stable")[:, -2:]
+    return order, peaks.sum(axis=1) >= 2
+
+
+def roll_rows(profiles, shifts, lengths):
+    """Roll each row of a NaN-padded 2D array by its own shift, like np.roll."""
+    cols = np.arange(profiles.shape[1])
+    lengths = np.maximum(lengths, 1)[:, None]
+    src = np.where(cols < lengths, (cols - shifts[:, None]) % lengths, cols)
+    return np.take_along_axis(profiles, src, axis=1)
+
+
+def _start_renderer():
+    import kaleido
+
+    # kaleido>=1 launches a browser for each export, unless a server is running
+    if hasattr(kaleido, "start_sync_server"):
+        kaleido.start_sync_server(silence_warnings=True)
+
+
+def _write_image(fig, path, width, height):
+    import plotly.io as pio
+
+    pio.write_image(fig, path, width=width, height=height)
+    return path
+
+
+def export_figures(figures, jobs=4, progress=None):
+    """
+    Write plotly figures as static images in a pool of worker processes.
+
+    Each worker keeps its own image renderer (kaleido) alive between figures, so
+    the start-up cost is paid once per worker instead of once per figure.
+
+    figures: list of (figure, path, width, height)
+    progress: optional rich Progress to report to
+    """
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if not figures:
+        return
+    with ProcessPoolExecutor(
+        min(jobs, len(figures)), initializer=_start_renderer
+    ) as pool:
+        futures = [
+            pool.submit(_write_image, fig.to_dict(), path, width, height)
+            for fig, path, width, height in figures
+        ]
+        done = as_completed(futures)
+        if progress is not None:
+            done = progress.track(done, total=len(futures), description="Exporting...")
+        for fut in done:
+            fut.result()
@@ -0,0 +1,342 @@
+import click
+
+
+@click.group()
+def cli():
+    """Project re-extracted and straightened membranes and get some stats."""
+    pass
+
+
+@cli.command()
+@click.argument(
+    "paths", nargs=-1, type=click.Path(exists=True, dir_okay=False, resolve_path=True)
+)
+@click.option(
+    "-o", "--output", required=True, type=click.Path(dir_okay=True, resolve_path=True)
+)
+@click.option("-s", "--chunk-size", type=int, default=35)
+@click.option(
+    "--select",
+    type=click.Choice(["manual", "auto", "review"]),
+    default="manual",
+    help="manual: pick chunks in napari; auto: keep chunks based on their quality "
+    "scores, without user interaction; review: like auto, but open napari "
+    "with the automatic selection for review",
+)
+@click.option(
+    "--max-nan",
+    type=float,
+    default=0.2,
+    help="maximum fraction of NaN pixels of a chunk for automatic selection",
+)
+@click.option(
+    "--min-contrast",
+    type=float,
+    default=0.5,
+    help="minimum contrast of a chunk for automatic selection, "
+    "relative to the median contrast of the volume",
+)
+@click.option(
+    "-j", "--jobs", type=int, default=4, help="number of volumes projected at once"
+)
+@click.option("-f", "--overwrite", is_flag=True)
+def prepare(paths, output, chunk_size, select, max_nan, min_contrast, jobs, overwrite):
+    """
+    Generate and select 2D chunked projections for the input data.
+
+    Projections are streamed from disk and computed in parallel. Chunk quality
+    scores (NaN fraction and contrast) are saved for each volume in chunk_scores.csv.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from pathlib import Path
+
+    import numpy as np
+    from rich.progress import Progress
+
+    from .funcs import auto_select, prepare_volume, save_projection
+
+    def get_correct_entry(viewer, event):
+        for lay in reversed(viewer.layers):
+            shift = lay._translate_grid[0]
+            pos = np.array(event.position)[0]
+            if np.all(pos >= shift):
+                return lay.name
+        return None
+
+    def open_entry(viewer, event):
+        if event.modifiers:
+            return
+        entry = get_correct_entry(viewer, event)
+        if entry is not None:
+            viewer.layers[entry].visible = not viewer.layers[entry].visible
+
+    outdir = Path(output)
+    outdir.mkdir(parents=True, exist_ok=True)
+
+    volumes = [Path(p) for p in paths]
+    with ProcessPoolExecutor(jobs) as pool, Progress() as progress:
+        prepared = list(
+            progress.track(
+                pool.map(
+                    partial(
+                        prepare_volume,
+                        outdir=outdir,
+                        chunk_size=chunk_size,
+                        overwrite=overwrite,
+                    ),
+                    volumes,
+                ),
+                total=len(volumes),
+                description="Projecting...",
+            )
+        )
+
+    for name, px_size, chunks, scores in prepared:
+        selected = auto_select(scores, max_nan=max_nan, min_contrast=min_contrast)
+        if select == "auto":
+            print(f"{name}: selected {selected.sum()}/{len(chunks)} chunks")
+            to_save = selected[selected].index
+        else:
+            import napari
+
+            # open napari to view projections and save them
+            print(f"Opening {name}...")
+            v = napari.Viewer()
+            for idx, chunk in enumerate(chunks):
+                v.add_image(
+                    chunk,
+                    name=f"{name}_{idx:02}",
+                    contrast_limits=(0, 1),
+                    metadata={"idx": idx},
+                    visible=select == "manual" or bool(selected[idx]),
+                )
+
+            v.mouse_double_click_callbacks.append(open_entry)
+
+            v.grid.enabled = True
+            v.grid.stride = -1
+            v.grid.shape = (-1, 1)
+            napari.run()
+
+            to_save = [lay.metadata["idx"] for lay in v.layers if lay.visible]
+
+        print(f"Saving {name}...")
+        subdir = outdir / name
+        for idx in to_save:
+            save_projection(
+                chunks[idx],
+                subdir / f"{name}_projZ_{idx:02}.mrc",
+                px_size,
+                overwrite=overwrite,
+            )
+
+
+@cli.command()
+@click.argument(
+    "proj_dir", type=click.Path(exists=True, dir_okay=True, resolve_path=True)
+)
+@click.option("--show/--no-show", default=True, help="open the plots in a browser")
+@click.option(
+    "--summary-only",
+    is_flag=True,
+    help="only export summary plots, and not the plot of each chunk",
+)
+@click.option(
+    "-j", "--jobs", type=int, default=4, help="number of processes exporting plots"
+)
+@click.option("-f", "--overwrite", is_flag=True)
+def compute(proj_dir, show, summary_only, jobs, overwrite):
+    """
+    Take the outputs from prepare and compute statistics and plots.
+
+    Numerical results are saved first; plots are exported at the end, in parallel.
+    """
+    import re
+    import warnings
+    from inspect import cleandoc
+    from pathlib import Path
+
+    import mrcfile
+    import numpy as np
+    import pandas as pd
+    import plotly.express as px
+    from rich.progress import Progress
+
+    from .funcs import (
+        export_figures,
+        normalize,
+        roll_rows,
+        rolling_mean,
+        stack_profiles,
+        top_two_peaks,
+    )
+
+    # profiles of all chunks of all membranes are analysed at once, as the rows
+    # of a single NaN-padded array; each membrane is a contiguous group of rows
+    names = []
+    chunk_ids = []
+    profiles = []
+    px_sizes = {}
+
+    proj_dir = Path(proj_dir)
+    for subdir in sorted(proj_dir.iterdir()):
+        if not subdir.is_dir():
+            print(f"Ignoring {subdir}: not a directory.")
+            continue
+        name = subdir.stem
+        for proj in sorted(subdir.glob("*projZ_??.mrc")):
+            idx = int(re.search(r"projZ_(\d\d)", proj.stem).group(1))
+            with mrcfile.open(proj) as mrc:
+                px_sizes[name] = mrc.voxel_size.x.item()
+                with warnings.catch_warnings():
+                    warnings.filterwarnings("ignore", "mean of empty slice")
+                    profiles.append(normalize(np.nanmean(mrc.data, axis=0)))
+            names.append(name)
+            chunk_ids.append(idx)
+
+    if not profiles:
+        return
+    names = np.array(names)
+    chunk_ids = np.array(chunk_ids)
+    profiles, lengths = stack_profiles(profiles)
+    profiles_avg = rolling_mean(profiles, window=5)
+
+    # find the 2 highest peaks: dark (low) peaks are membranes, white between them
+    high_peaks, has_high = top_two_peaks(profiles_avg, lengths, height=0.2)
+    low_peaks, has_low = top_two_peaks(1 - profiles_avg, lengths, height=0.2)
+
+    # align main low peaks to the ones of the first chunk of each membrane
+    main_low_peaks = np.where(has_low, low_peaks.min(axis=1), 0)
+    _, first, group = np.unique(names, return_index=True, return_inverse=True)
+    shifts = main_low_peaks[first][group] - main_low_peaks
+    aligned = roll_rows(profiles, shifts, lengths)
+
+    thickness_dark = np.where(has_low, np.abs(np.diff(low_peaks, axis=1))[:, 0], 0)
+    thickness_white = np.where(has_high, np.abs(np.diff(high_peaks, axis=1))[:, 0], 0)
+    px_by_row = np.array([px_sizes[name] for name in names])
+    thickness_dark = thickness_dark * px_by_row
+    thickness_white = thickness_white * px_by_row
+
+    # figures are exported all together at the end
+    figures = []
+    for name in px_sizes:
+        rows = names == name
+        length = lengths[rows].max()
+        # plot aligned plots
+        df = pd.DataFrame(aligned[rows, :length].T, columns=chunk_ids[rows])
+        df.index = np.arange(len(df)) * px_sizes[name]
+        df.sort_index(inplace=True, axis=1)
+        df.to_csv(proj_dir / name / "profiles.csv")
+
+        fig = px.line(df, title=f"Density profile of {name} by chunks")
+        fig.update_layout(xaxis_title="Position (Å)", yaxis_title="Normalised density")
+        if show:
+            fig.show()
+        figures.append((fig, proj_dir / name / "profiles.png", 1400, 700))
+
+        # also average
+        fig = px.line(df.mean(axis=1), title=f"Mean density profile of {name}")
+        fig.update_layout(xaxis_title="Position (Å)", yaxis_title="Normalised density")
+        if show:
+            fig.show()
+        figures.append((fig, proj_dir / name / "profile_average.png", 1400, 700))
+        # save individual plots
+        for col in [] if summary_only else df:
+            fig = px.line(
+                df[col], title=f"Density profile of {name}, chunk {int(col):02}"
+            )
+            fig.update_layout(
+                xaxis_title="Position (Å)", yaxis_title="Normalised density"
+            )
+            figures.append(
+                (fig, proj_dir / name / f"profile_{int(col):02}.png", 1400, 700)
+            )
+
+        # thicknesses
+        df = pd.DataFrame(
+            {
+                "thickness_dark_A": thickness_dark[rows],
+                "thickness_white_A": thickness_white[rows],
+            },
+            index=chunk_ids[rows],
+        )
+        df.index.name = "chunk"
+        df.sort_index(inplace=True)
+
+        fig = px.violin(df, title=f"Thickness distribution of {name}")
+        fig.update_layout(yaxis_title="Thickness (Å)")
+        if show:
+            fig.show()
+        figures.append((fig, proj_dir / name / "thickness.png", 700, 700))
+
+        df.to_csv(proj_dir / name / "thickness.csv")
+        print(f"--- {name} ---")
+        print(df)
+        print(
+            f"average thickness (dark):  {df.thickness_dark_A.mean():.2f}, std={df.thickness_dark_A.std(ddof=0):.2f}"
+        )
+        print(
+            f"average thickness (white): {df.thickness_white_A.mean():.2f}, std={df.thickness_white_A.std(ddof=0):.2f}"
+        )
+
+    with Progress() as progress:
+        export_figures(figures, jobs=jobs, progress=progress)
+
+    print(
+        cleandoc(
+            """
+            NOTE: Some thicknesses are computed incorrectly due to inconsistent peak heights.
+                  Look through the data and manually fix the ones that look obviously wrong
+                  before continuing to the next step, or they will mess up the results.
+            """
+        )
+    )
+
+
+@cli.command()
+@click.argument(
+    "inputs", nargs=-1, type=click.Path(exists=True, dir_okay=True, resolve_path=True)
+)
+@click.option(
+    "-o",
+    "--output-name",
+    type=str,
+    help="Title/filename given to the aggregated outputs.",
+)
+@click.option("--show/--no-show", default=True, help="open the plot in a browser")
+def aggregate(inputs, output_name, show):
+    """Aggregate the generated data into general stats about given subsets.
+
+    Inputs are subdirectories of the project_dir from compute.
+    """
+    from pathlib import Path
+
+    import pandas as pd
+    import plotly.express as px
+
+    dfs = []
+    names = []
+
+    for subdir in inputs:
+        subdir = Path(subdir)
+        if not subdir.is_dir():
+            print(f"Ignoring {subdir}: not a directory.")
+            continue
+        names.append(subdir.stem)
+        dfs.append(pd.read_csv(subdir / "thickness.csv", index_col=0))
+
+    df = pd.concat(dfs)
+    fig = px.violin(df, title=f"Aggregated thickness distribution of {output_name}.")
+    fig.update_layout(yaxis_title="Thickness (Å)")
+    if show:
+        fig.show()
+
+    out_img = subdir.parent / f"thickness_{output_name}.png"
+    fig.write_image(
+        out_img,
+        width=700,
+        height=700,
+    )
+    print(df.describe())
+    df.to_csv(out_img.with_suffix(".csv"))
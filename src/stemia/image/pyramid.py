@@ -0,0 +1,135 @@
+import click
+
+
+@click.command()
+@click.argument(
+    "input", type=click.Path(exists=True, dir_okay=False, resolve_path=True)
+)
+@click.argument(
+    "output", required=False, type=click.Path(file_okay=False, resolve_path=True)
+)
+@click.option(
+    "-l",
+    "--levels",
+    type=int,
+    default=None,
+    help="number of levels, including full resolution "
+    "[default: until the smallest axis is below --min-size]",
+)
+@click.option(
+    "--min-size",
+    type=int,
+    default=64,
+    help="smallest axis size of the coarsest level when --levels is not given",
+)
+@click.option(
+    "-c", "--chunk-size", type=int, default=64, help="size of the on-disk chunks"
+)
+@click.option("-f", "--overwrite", is_flag=True, help="overwrite output if exists")
+def cli(input, output, levels, min_size, chunk_size, overwrite):
+    """
+    Write a multiscale pyramid of a volume for fast browsing.
+
+    Levels are downsampled by 2 (by averaging) with respect to the previous one,
+    and are written to a chunked zarr store with OME-NGFF multiscales metadata.
+    The input is read only once, in slabs, so memory use does not depend on its size.
+
+    OUTPUT: output zarr directory [default: INPUT with .zarr extension]
+    """
+    from pathlib import Path
+
+    import mrcfile
+    import numpy as np
+    import zarr
+    from rich.progress import Progress
+
+    from ..utils.image_processing import downsample_mean
+
+    output = Path(input).with_suffix(".zarr") if output is None else Path(output)
+    if output.exists() and not overwrite:
+        raise click.UsageError(f'{output} exists but "-f" flag was not passed')
+
+    mrc = mrcfile.mmap(input, mode="r", permissive=True)
+    data = mrc.data
+    voxel_size = np.array(mrc.voxel_size.item()[::-1], dtype=float)
+    if levels is None:
+        levels = 1
+        while min(data.shape) // 2**levels >= min_size:
+            levels += 1
+
+    store = zarr.open_group(str(output), mode="w")
+    arrays = []
+    for lv in range(levels):
+        shape = tuple(n // 2**lv for n in data.shape)
+        arrays.append(
+            store.create_dataset(
+                str(lv),
+                shape=shape,
+                chunks=(chunk_size,) * len(shape),
+                dtype=data.dtype if lv == 0 else np.float32,
+            )
+        )
+
+    # each level buffers planes until a full layer of chunks can be written, and
+    # keeps the odd plane left over when pairing planes for the next level
+    buffers = [[] for _ in range(levels)]
+    written = [0] * levels
+    carry = [None] * levels
+
+    def flush(lv, final=False):
+        planes = np.concatenate(buffers[lv]) if buffers[lv] else None
+        buffers[lv] = []
+        if planes is None:
+            return
+        n = len(planes) if final else len(planes) // chunk_size * chunk_size
+        n = min(n, arrays[lv].shape[0] - written[lv])
+        arrays[lv][written[lv] : written[lv] + n] = planes[:n]
+        written[lv] += n
+        if n < len(planes) and not final:
+            buffers[lv].append(planes[n:])
+
+    def push(lv, planes):
+        buffers[lv].append(planes)
+        if sum(len(b) for b in buffers[lv]) >= chunk_size:
+            flush(lv)
+        if lv + 1 == levels:
+            return
+        if carry[lv] is not None:
+            planes = np.concatenate([carry[lv], planes])
+        carry[lv] = planes[-1:] if len(planes) % 2 else None
+        if len(planes) >= 2:
+            push(lv + 1, downsample_mean(planes[: len(planes) // 2 * 2]))
+
+    with Progress() as progress:
+        starts = range(0, data.shape[0], chunk_size)
+        for start in progress.track(starts, description="Downsampling..."):
+            push(0, np.asarray(data[start : start + chunk_size]))
+        for lv in range(levels):
+            flush(lv, final=True)
+    mrc.close()
+
+    # downsampling by averaging shifts the center of the first voxel
+    datasets = [
+        {
+            "path": str(lv),
+            "coordinateTransformations": [
+                {"type": "scale", "scale": list(voxel_size * 2**lv)},
+                {
+                    "type": "translation",
+                    "translation": list(voxel_size * (2**lv - 1) / 2),
+                },
+            ],
+        }
+        for lv in range(levels)
+    ]
+    store.attrs["multiscales"] = [
+        {
+            "version": "0.4",
+            "name": Path(input).stem,
+            "axes": [
+                {"name": ax, "type": "space", "unit": "angstrom"}
+                for ax in "zyx"[-data.ndim :]
+            ],
+            "datasets": datasets,
+        }
+    ]
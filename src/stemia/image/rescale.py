@@ -12,27 +12,174 @@ import click
     type=float,
     help="force input pizel size and ignore mrc header",
 )
+@click.option(
+    "-m",
+    "--method",
+    type=click.Choice(["spline", "chunked", "fourier"]),
+    default="spline",
+    help="spline: cubic spline zoom of the whole volume at once; "
+    "chunked: same as spline, but in slabs processed in parallel; "
+    "fourier: fourier crop/pad followed by a small spline correction of the "
+    "rounding of the output shape",
+)
+@click.option(
+    "--out-of-core",
+    is_flag=True,
+    help="with the fourier method, resample in slabs through temporary files, for "
+    "volumes that do not fit in memory (the chunked method is always out-of-core, "
+    "and stacks are always streamed in chunks)",
+)
+@click.option(
+    "--stack/--volume",
+    default=None,
+    help="treat input as a 2D image stack or as a volume [default: stack for .mrcs "
+    "files, volume otherwise]",
+)
+@click.option(
+    "-c",
+    "--chunk-size",
+    type=int,
+    default=256,
+    help="number of images processed at once in stack mode",
+)
+@click.option(
+    "-j",
+    "--workers",
+    type=int,
+    default=None,
+    help="number of threads for chunked and fourier methods [default: all cores]",
+)
 @click.option("-f", "--overwrite", is_flag=True, help="overwrite output if exists")
-def cli(input, output, target_pixel_size, input_pixel_size, overwrite):
+def cli(
+    input,
+    output,
+    target_pixel_size,
+    input_pixel_size,
+    method,
+    out_of_core,
+    stack,
+    chunk_size,
+    workers,
+    overwrite,
+):
     """
     Rescale an mrc image to the specified pixel size.
 
+    Image stacks (e.g: particles) are rescaled image by image, streaming through
+    the input in chunks.
+
     TARGET_PIXEL_SIZE: target pixel size in Angstrom
     """
+    import tempfile
     from pathlib import Path
 
     import mrcfile
+    import numpy as np
+    from rich.progress import Progress
     from scipy.ndimage import zoom
 
+    from ..utils.image_processing import (
+        fourier_resample,
+        fourier_resample_slabs,
+        zoom_chunked,
+    )
+    from ..utils.io_ import map_mrc_stack
+
     if Path(output).is_file() and not overwrite:
         raise click.UsageError(f'{output} exists but "-f" flag was not passed')
-    mrc = mrcfile.open(input)
-    if mrc.voxel_size.x == target_pixel_size:
+    if out_of_core and method != "fourier":
+        raise click.UsageError("--out-of-core is only used with the fourier method")
+    mrc = mrcfile.mmap(input, mode="r")
+    px_size = input_pixel_size or mrc.voxel_size.x
+    if px_size == target_pixel_size:
         raise click.UsageError(
             f"{input} already at {target_pixel_size} A/px. If the header is wrong, "
             "provide an input pixel size with --input-pixel-size"
         )
-    factor = mrc.voxel_size.x / target_pixel_size
-    rescaled = zoom(mrc.data, factor)
-    new = mrcfile.new(output, rescaled, overwrite=overwrite)
-    new.header.cella = target_pixel_size * new.header.nx
+    factor = px_size / target_pixel_size
+    fft_workers = -1 if workers is None else workers
+    # keep temporary files close to the output, system tmp is often small
+    tmp = Path(output).parent
+
+    def fourier_rescale(img, shape, out, axes, slabs=out_of_core):
+        # fourier resampling can only output integer shapes, which changes the pixel
+        # size slightly; correct with a spline zoom of the (small) difference
+        scale = np.ones(img.ndim)
+        scale[list(axes)] = np.divide(shape, np.take(img.shape, axes)) / factor
+        needs_correction = not np.allclose(scale, 1)
+        if not slabs:
+            resampled = fourier_resample(img, shape, axes=axes, workers=fft_workers)
+            if needs_correction:
+                zoom_chunked(resampled, out, scale, workers=workers)
+            else:
+                out[:] = resampled
+            return out
+
+        if not needs_correction:
+            return fourier_resample_slabs(
+                img, out, axes=axes, workers=fft_workers, tmp_dir=tmp
+            )
+        with tempfile.TemporaryDirectory(dir=tmp) as tmp_res:
+            resampled = np.memmap(
+                f"{tmp_res}/resampled.dat",
+                dtype=np.float32,
+                mode="w+",
+                shape=out.shape,
+            )
+            fourier_resample_slabs(
+                img, resampled, axes=axes, workers=fft_workers, tmp_dir=tmp
+            )
+            zoom_chunked(resampled, out, scale, workers=workers, tmp_dir=tmp)
+            del resampled
+        return out
+
+    if stack is None:
+        # the mrc header is not reliable: many tomograms have ispg=0
+        stack = Path(input).suffix == ".mrcs"
+    if stack:
+        nz, ny, nx = mrc.data.shape
+        shape = (nz, round(ny * factor), round(nx * factor))
+        if method == "fourier":
+
+            def rescale_images(imgs):
+                out = np.empty((len(imgs), *shape[1:]), dtype=np.float32)
+                # chunks of a stack already fit in memory
+                return fourier_rescale(imgs, shape[1:], out, axes=(1, 2), slabs=False)
+
+        else:
+
+            def rescale_images(imgs):
+                return np.stack([zoom(img, factor) for img in imgs])
+
+        with Progress() as progress:
+            map_mrc_stack(
+                rescale_images,
+                input,
+                output,
+                shape=shape,
+                chunk_size=chunk_size,
+                voxel_size=target_pixel_size,
+                overwrite=overwrite,
+                progress=progress,
+            )
+        mrc.close()
+        return
+
+    if method == "spline":
+        rescaled = zoom(mrc.data, factor)
+        with mrcfile.new(output, rescaled, overwrite=overwrite) as new:
+            new.voxel_size = target_pixel_size
+        mrc.close()
+        return
+
+    # same output shape as ndimage.zoom
+    shape = tuple(round(s * factor) for s in mrc.data.shape)
+    with mrcfile.new_mmap(output, shape, mrc_mode=2, overwrite=overwrite) as new:
+        new.voxel_size = target_pixel_size
+        if method == "chunked":
+            # same coordinate mapping as ndimage.zoom
+            scale = [(s - 1) / (n - 1) for s, n in zip(mrc.data.shape, shape)]
+            zoom_chunked(mrc.data, new.data, scale, workers=workers, tmp_dir=tmp)
+        else:
+            fourier_rescale(mrc.data, shape, new.data, axes=range(len(shape)))
+    mrc.close()
@@ -21,6 +21,25 @@ def crop_center(img, keep, axis="xy"):
     return img[starty : starty + cropy, startx : startx + cropx]
 
 
+def resize_center(img, shape, fill=0):
+    """
+    Crop or pad an image around its center to a new shape.
+
+    Padded regions are set to fill. Works on any number of dimensions.
+    """
+    out = np.full(shape, fill, dtype=img.dtype)
+    src, dst = [], []
+    for n_in, n_out in zip(img.shape, shape):
+        # keep the center pixel (n // 2) in place
+        start_in = max(0, n_in // 2 - n_out // 2)
+        start_out = max(0, n_out // 2 - n_in // 2)
+        size = min(n_in, n_out)
+        src.append(slice(start_in, start_in + size))
+        dst.append(slice(start_out, start_out + size))
+    out[tuple(dst)] = img[tuple(src)]
+    return out
+
+
 def binarise(img, percentile):
     """Binarise an image given a percentile threshold."""
     threshold = np.percentile(img, percentile)
@@ -47,6 +66,264 @@ def fourier_translate(img, shift):
     return np.real(np.fft.ifftn(trans_ft)).astype(np.float32)
 
 
+def _fourier_indices(n_in, n_out, half=False):
+    """
+    Indices of the frequencies shared by two fourier transforms of different sizes.
+
+    Returns the indices in the input and the output transforms, with negative
+    frequencies at the end (unshifted layout). If half, the axis is the last
+    axis of a real transform and only contains positive frequencies.
+
+    If the sizes differ and the smallest is even, its nyquist frequency is left
+    out: it has no unique counterpart in the other transform, and dropping it
+    keeps resampling separable (resampling one axis at a time gives the same
+    result as resampling all of them at once).
+    """
+    if n_in == n_out:
+        idx = np.arange(n_in // 2 + 1 if half else n_in)
+        return idx, idx
+    # highest frequency kept
+    k = (min(n_in, n_out) - 1) // 2
+    if half:
+        idx = np.arange(k + 1)
+        return idx, idx
+    pos = np.arange(k + 1)
+    neg = np.arange(-k, 0)
+    return np.concatenate([pos, neg + n_in]), np.concatenate([pos, neg + n_out])
+
+
+def fourier_resample(img, shape, axes=None, workers=None, lowpass=None):
+    """
+    Resample an image to a new shape by cropping or padding in fourier space.
+
+    Uses real transforms in single precision and picks the retained frequencies
+    by index, so no shifted copies of the transform are made. Intensities are
+    preserved (the mean does not change).
+
+    shape: new size of each of the transformed axes
+    axes: axes to resample (default: all)
+    workers: number of threads used by scipy.fft (-1 for all cores)
+    lowpass: if given, also apply a lowpass filter at this spatial frequency (in
+        cycles per pixel of the input image), with a smoothstep edge 2 fourier
+        pixels wide. Can be one value per axis, for anisotropic pixel sizes
+    """
+    from scipy.fft import irfftn, rfftn
+
+    axes = tuple(range(img.ndim)) if axes is None else tuple(axes)
+    img = np.asarray(img, dtype=np.float32)
+    ft = rfftn(img, axes=axes, norm="forward", workers=workers)
+
+    out_shape = list(ft.shape)
+    idx_in = [np.arange(n) for n in ft.shape]
+    idx_out = [np.arange(n) for n in ft.shape]
+    for ax, n_out in zip(axes, shape):
+        half = ax == axes[-1]
+        idx_in[ax], idx_out[ax] = _fourier_indices(img.shape[ax], n_out, half=half)
+        out_shape[ax] = n_out // 2 + 1 if half else n_out
+
+    ft_out = np.zeros(out_shape, dtype=ft.dtype)
+    ft_out[np.ix_(*idx_out)] = ft[np.ix_(*idx_in)]
+    del ft
+
+    if lowpass is not None:
+        lowpass = np.broadcast_to(np.asarray(lowpass, dtype=np.float32), len(axes))
+        # radial frequency of each element of the output, relative to the cutoff
+        freq_sq = np.zeros((1,) * img.ndim, dtype=np.float32)
+        for ax, n_out, cutoff in zip(axes, shape, lowpass):
+            fftfreq = np.fft.rfftfreq if ax == axes[-1] else np.fft.fftfreq
+            freq = fftfreq(n_out).astype(np.float32) * n_out / img.shape[ax] / cutoff
+            freq_sq = freq_sq + np.expand_dims(
+                freq**2, [i for i in range(img.ndim) if i != ax]
+            )
+        edge = min(2 / (img.shape[ax] * cutoff) for ax, cutoff in zip(axes, lowpass))
+        ft_out *= smoothstep_normalized(np.sqrt(freq_sq), 1 - edge, 1)
+
+    return irfftn(ft_out, s=shape, axes=axes, norm="forward", workers=workers)
+
+
+def fourier_resample_slabs(
+    img, out, axes=None, slab_size=32, workers=None, tmp_dir=None
+):
+    """
+    Out-of-core version of fourier_resample.
+
+    Fourier resampling is separable, so the first axis is resampled in slabs along
+    the second axis and the result is stored in a temporary memory map; the other
+    axes are then resampled in slabs along the first axis, and written to `out`.
+    If the first axis is not resampled (e.g. image stacks), the first pass is
+    skipped. Both img and out can be memory maps: peak memory is a few times the
+    slab size.
+
+    out: array with the target shape, written in place
+    axes: axes to resample (default: all)
+    slab_size: number of planes processed at once
+    tmp_dir: directory for the temporary file (default: system temporary directory)
+    """
+    import tempfile
+
+    axes = tuple(range(img.ndim)) if axes is None else tuple(axes)
+    others = tuple(ax for ax in axes if ax != 0)
+
+    def resample_others(src):
+        for start in range(0, out.shape[0], slab_size):
+            slab = np.s_[start : start + slab_size]
+            if others:
+                out[slab] = fourier_resample(
+                    src[slab],
+                    [out.shape[ax] for ax in others],
+                    axes=others,
+                    workers=workers,
+                )
+            else:
+                out[slab] = src[slab]
+
+    if 0 not in axes:
+        resample_others(img)
+        return out
+    if img.ndim == 1:
+        out[:] = fourier_resample(img, out.shape, workers=workers)
+        return out
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+        partial = np.memmap(
+            f"{tmp}/partial.dat",
+            dtype=np.float32,
+            mode="w+",
+            shape=(out.shape[0], *img.shape[1:]),
+        )
+        for start in range(0, img.shape[1], slab_size):
+            slab = np.s_[:, start : start + slab_size]
+            partial[slab] = fourier_resample(
+                img[slab], (out.shape[0],), axes=(0,), workers=workers
+            )
+        resample_others(partial)
+        del partial
+    return out
+
+
+def spline_filter_slabs(img, out, order=3, slab_size=32, workers=None):
+    """
+    Spline prefilter of an image (like ndimage.spline_filter), in slabs.
+
+    The filter is separable, so the first axis is filtered in slabs along the
+    second axis, and the other axes in slabs along the first axis. Both img and
+    out can be memory maps: peak memory is a few times the slab size.
+
+    out: array with the shape of img, written in place
+    workers: number of threads (default: number of cores)
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from scipy.ndimage import spline_filter1d
+
+    def filter_first(start):
+        slab = np.s_[:, start : start + slab_size]
+        out[slab] = spline_filter1d(img[slab], order, axis=0, output=np.float64)
+
+    def filter_others(start):
+        slab = np.s_[start : start + slab_size]
+        filtered = np.asarray(out[slab], dtype=np.float64)
+        for ax in range(1, img.ndim):
+            filtered = spline_filter1d(filtered, order, axis=ax)
+        out[slab] = filtered
+
+    with ThreadPoolExecutor(workers) as pool:
+        # consume the iterators so exceptions are raised
+        if img.ndim > 1:
+            list(pool.map(filter_first, range(0, img.shape[1], slab_size)))
+            list(pool.map(filter_others, range(0, img.shape[0], slab_size)))
+        else:
+            out[:] = spline_filter1d(img, order, output=np.float64)
+    return out
+
+
+def zoom_chunked(
+    img,
+    out,
+    scale,
+    offset=0,
+    order=3,
+    chunk_size=32,
+    halo=8,
+    workers=None,
+    tmp_dir=None,
+):
+    """
+    Resample an image with splines, in slabs along the first axis.
+
+    Each output voxel j is interpolated at input coordinate j * scale + offset
+    (per axis), like ndimage.affine_transform. The spline coefficients of the
+    whole image are computed first with spline_filter_slabs, so results match
+    ndimage.zoom and affine_transform to float precision. Output coordinates past
+    the edges of the input are mirrored back instead of being set to 0 (rounding
+    can put the last plane just past the edge). Slabs are then interpolated in a
+    thread pool and written to `out` (which can be a memory map) as soon as they
+    are ready.
+
+    scale, offset: scalars or sequences with one value per axis
+    halo: extra input planes read on each side of a slab (at least order)
+    workers: number of threads (default: number of cores)
+    tmp_dir: if given, store the spline coefficients in a temporary memory map
+        in this directory instead of in memory
+    """
+    import tempfile
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+
+    from scipy.ndimage import affine_transform
+
+    scale = np.broadcast_to(np.asarray(scale, dtype=float), (img.ndim,))
+    offset = np.broadcast_to(np.asarray(offset, dtype=float), (img.ndim,))
+    halo = max(halo, order)
+
+    def process(coeffs, start):
+        stop = min(start + chunk_size, out.shape[0])
+        first = start * scale[0] + offset[0]
+        last = (stop - 1) * scale[0] + offset[0]
+        lo = min(max(0, int(np.floor(first)) - halo), img.shape[0] - 1)
+        hi = max(min(img.shape[0], int(np.ceil(last)) + halo + 1), lo + 1)
+        out[start:stop] = affine_transform(
+            coeffs[lo:hi],
+            scale,
+            offset=(first - lo, *offset[1:]),
+            output_shape=(stop - start, *out.shape[1:]),
+            order=order,
+            # inside the image, same as the default constant mode of zoom
+            mode="mirror",
+            prefilter=False,
+        )
+
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+        if order > 1:
+            if tmp_dir is not None:
+                coeffs = np.memmap(
+                    f"{tmp}/coeffs.dat", dtype=np.float32, mode="w+", shape=img.shape
+                )
+            else:
+                coeffs = np.empty(img.shape, dtype=np.float32)
+            spline_filter_slabs(
+                img, coeffs, order=order, slab_size=chunk_size, workers=workers
+            )
+        else:
+            coeffs = img
+        with ThreadPoolExecutor(workers) as pool:
+            # consume the iterator so exceptions are raised
+            list(pool.map(partial(process, coeffs), range(0, out.shape[0], chunk_size)))
+        del coeffs
+    return out
+
+
+def downsample_mean(img):
+    """
+    Downsample an image by 2 along each axis by averaging blocks of 2^ndim pixels.
+
+    Odd trailing pixels along any axis are dropped.
+    """
+    img = img[tuple(slice(0, n // 2 * 2) for n in img.shape)]
+    blocks = img.reshape([n for s in img.shape for n in (s // 2, 2)])
+    return blocks.mean(axis=tuple(range(1, 2 * img.ndim, 2)), dtype=np.float32)
+
+
 def label_features(img, kernel=None):
     """Generate image labels given a certain kernel."""
     from scipy.ndimage import label
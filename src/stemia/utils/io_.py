@@ -15,6 +15,73 @@ def write_mrc(data, path, overwrite=False, from_header=None):
             mrc.header.cella = from_header.cella
 
 
+def map_mrc_stack(
+    func,
+    input_path,
+    output_path,
+    shape,
+    chunk_size=256,
+    voxel_size=None,
+    overwrite=False,
+    progress=None,
+):
+    """
+    Apply a function to chunks of images of an mrc stack and write the results.
+
+    The input is memory-mapped and the output is written incrementally, so memory
+    usage only depends on chunk_size.
+
+    func: called on each (n, y, x) chunk, must return an array of shape (n, *shape[1:])
+    shape: shape of the output stack
+    voxel_size: voxel size of the output
+    progress: optional rich Progress to report to
+    """
+    import mrcfile
+
+    with mrcfile.mmap(input_path, "r") as src, mrcfile.new_mmap(
+        output_path, shape=shape, mrc_mode=2, overwrite=overwrite
+    ) as dst:
+        dst.set_image_stack()
+        if voxel_size is not None:
+            dst.voxel_size = voxel_size
+        starts = range(0, shape[0], chunk_size)
+        if progress is not None:
+            starts = progress.track(starts, description="Processing chunks...")
+        for start in starts:
+            chunk = slice(start, start + chunk_size)
+            dst.data[chunk] = func(src.data[chunk])
+
+
+def read_pyramid_level(path, min_shape=None):
+    """
+    Open the coarsest level of a multiscale zarr pyramid that is large enough.
+
+    min_shape: minimum size of each axis (zyx), 0 to ignore an axis. If None, the
+        full resolution level is returned
+    Returns the (lazy) zarr array, its voxel size (zyx) and its downsampling factor
+    relative to the full resolution level.
+    """
+    import numpy as np
+    import zarr
+
+    group = zarr.open_group(str(path), mode="r")
+    datasets = group.attrs["multiscales"][0]["datasets"]
+    scales = [
+        np.array(ds["coordinateTransformations"][0]["scale"], dtype=float)
+        for ds in datasets
+    ]
+    # levels are ordered from full resolution to coarsest
+    level = 0
+    if min_shape is not None:
+        for level in reversed(range(len(datasets))):
+            shape = group[datasets[level]["path"]].shape
+            if all(s >= n for s, n in zip(shape, min_shape)):
+                break
+    data = group[datasets[level]["path"]]
+    scale = scales[level]
+    return data, scale, scale / scales[0]
+
+
 def read_particle_star(path):
     """Read a star file."""
     import pandas as pd
@@ -0,0 +1,160 @@
+import json
+
+import numpy as np
+import pytest
+
+PARTICLE_DTYPE = [
+    ("uid", "<u8"),
+    ("blob/path", "S32"),
+    ("blob/idx", "<u4"),
+    ("ctf/df1_A", "<f4"),
+    ("ctf/df2_A", "<f4"),
+    ("alignments3D/shift", "<f4", (2,)),
+    ("alignments3D/pose", "<f4", (3,)),
+    ("location/micrograph_uid", "<u8"),
+]
+
+REFINE_DTYPE = [
+    ("uid", "<u8"),
+    ("alignments3D/pose", "<f4", (3,)),
+    ("alignments3D/error", "<f4"),
+]
+
+MICROGRAPH_DTYPE = [
+    ("uid", "<u8"),
+    ("micrograph_blob/path", "S32"),
+    ("ctf/df1_A", "<f4"),
+    ("ctf/df2_A", "<f4"),
+    ("ctf/ctf_fit_to_A", "<f4"),
+]
+
+
+def write_cs(path, dtype, n, rng, **values):
+    arr = np.zeros(n, dtype=dtype)
+    for name in arr.dtype.names:
+        if arr[name].dtype.kind == "f":
+            arr[name] = rng.random(arr[name].shape, dtype=np.float32)
+    for name, val in values.items():
+        arr[name.replace("__", "/")] = val
+    with open(path, "wb") as f:
+        np.save(f, arr)
+    return arr
+
+
+def write_job(project, uid, job_type, parents, outputs):
+    job_dir = project / uid
+    job_dir.mkdir(parents=True, exist_ok=True)
+    meta = {
+        "uid": uid,
+        "type": job_type,
+        "parents": parents,
+        "output_results": [
+            {"group_name": group, "metafiles": files, "passthrough": passthrough}
+            for group, files, passthrough in outputs
+        ],
+        "launched_at": {"$date": 1_600_000_000_000},
+        "started_at": {"$date": 1_600_000_060_000},
+        "completed_at": {"$date": 1_600_003_600_000},
+        "failed_at": None,
+        "interactive": False,
+        "run_on_master_direct": False,
+        "resources_needed": {"slots": {"CPU": 2, "GPU": 1}},
+    }
+    (job_dir / "job.json").write_text(json.dumps(meta))
+    return job_dir
+
+
+@pytest.fixture(autouse=True)
+def cache_home(tmp_path_factory, monkeypatch):
+    """Keep the on-disk caches of stemia out of the user's cache directory."""
+    path = tmp_path_factory.mktemp("cache")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(path))
+    return path / "stemia"
+
+
+@pytest.fixture(scope="session")
+def cs_project(tmp_path_factory):
+    """
+    A small cryosparc project.
+
+    J1: ctf estimation (micrographs only)
+    J2: extraction of particles from J1
+    J3: refinement of most particles of J2
+    J4: refinement of a subset of J3, with some poses changed
+    """
+    rng = np.random.default_rng(0)
+    project = tmp_path_factory.mktemp("cryosparc") / "P1"
+    project.mkdir()
+    n_mics, n_parts = 20, 500
+
+    mic_uid = rng.choice(2**62, n_mics, replace=False).astype(np.uint64) + 2**63
+    mic_path = [f"J1/mic_{idx}.mrc".encode() for idx in range(n_mics)]
+    write_job(
+        project,
+        "J1",
+        "patch_ctf_estimation_multi",
+        [],
+        [("exposures", ["J1/J1_micrographs_ctf_estimated.cs"], False)],
+    )
+    mics = write_cs(
+        project / "J1" / "J1_micrographs_ctf_estimated.cs",
+        MICROGRAPH_DTYPE,
+        n_mics,
+        rng,
+        uid=mic_uid,
+        micrograph_blob__path=mic_path,
+    )
+
+    part_uid = rng.choice(2**62, n_parts, replace=False).astype(np.uint64) + 2**63
+    write_job(
+        project,
+        "J2",
+        "extract_micrographs_multi",
+        ["J1"],
+        [
+            ("particles", ["J2/J2_particles.cs"], False),
+            ("micrographs", ["J2/J2_passthrough_micrographs.cs"], True),
+        ],
+    )
+    parts = write_cs(
+        project / "J2" / "J2_particles.cs",
+        PARTICLE_DTYPE,
+        n_parts,
+        rng,
+        uid=part_uid,
+        blob__path=[f"J2/extract/{idx % 7}.mrc".encode() for idx in range(n_parts)],
+        location__micrograph_uid=rng.choice(mic_uid, n_parts),
+    )
+    with open(project / "J2" / "J2_passthrough_micrographs.cs", "wb") as f:
+        np.save(f, mics)
+
+    for uid, parent, keep in [("J3", "J2", 450), ("J4", "J3", 300)]:
+        write_job(
+            project,
+            uid,
+            "homo_refine_new",
+            [parent],
+            [
+                ("particles", [f"{uid}/{uid}_particles.cs"], False),
+                ("particles", [f"{uid}/{uid}_passthrough_particles.cs"], True),
+            ],
+        )
+        parts = parts[np.sort(rng.choice(len(parts), keep, replace=False))]
+        refined = write_cs(
+            project / uid / f"{uid}_particles.cs",
+            REFINE_DTYPE,
+            keep,
+            rng,
+            uid=parts["uid"],
+        )
+        if uid == "J4":
+            # only some poses change between J3 and J4
+            previous = np.load(project / "J3" / "J3_particles.cs")
+            same = np.isin(previous["uid"], parts["uid"])
+            refined["alignments3D/pose"][::2] = previous["alignments3D/pose"][same][::2]
+            with open(project / uid / f"{uid}_particles.cs", "wb") as f:
+                np.save(f, refined)
+        with open(project / uid / f"{uid}_passthrough_particles.cs", "wb") as f:
+            np.save(f, parts)
+
+    return project
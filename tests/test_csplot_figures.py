@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stemia.cryosparc.csplot.figures import binned_histogram
+
+
+def bars(fig):
+    (trace,) = fig.data
+    return np.asarray(trace.x, dtype=float), np.asarray(trace.y), trace.width
+
+
+@pytest.mark.parametrize("dtype", ["int64", "uint32", "float32"])
+def test_histogram_constant(dtype):
+    x = pd.Series(np.full(10, 7), dtype=dtype, name="class")
+    centers, counts, width = bars(binned_histogram(x))
+    np.testing.assert_array_equal(centers, [7])
+    np.testing.assert_array_equal(counts, [10])
+    assert width == 1
+
+
+def test_histogram_constant_with_nan():
+    x = pd.Series([np.nan, 2.5, 2.5, np.inf], name="value")
+    centers, counts, width = bars(binned_histogram(x))
+    np.testing.assert_array_equal(centers, [2.5])
+    np.testing.assert_array_equal(counts, [2])
+    assert width == 1
+
+
+def test_histogram_integers():
+    x = pd.Series([0, 1, 1, 3, 3, 3], name="class")
+    centers, counts, width = bars(binned_histogram(x))
+    np.testing.assert_array_equal(centers, [0, 1, 3])
+    np.testing.assert_array_equal(counts, [1, 2, 3])
+    assert width == 1
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from stemia.cryosparc.csplot.join import outer_join
+
+
+def merge_all(tables, on):
+    """Reference: successive outer merges, without repeating columns."""
+    result = tables[0]
+    for table in tables[1:]:
+        shared = [c for c in result.columns if c != on]
+        table = table.drop(columns=shared, errors="ignore")
+        result = pd.merge(result, table, on=on, how="outer")
+    return result
+
+
+def assert_same_values(result, expected):
+    assert list(result.columns) == list(expected.columns)
+    assert len(result) == len(expected)
+    for col in expected.columns:
+        res = result[col].reset_index(drop=True)
+        exp = expected[col].reset_index(drop=True)
+        missing = exp.isna().to_numpy()
+        np.testing.assert_array_equal(res.isna().to_numpy(), missing, err_msg=col)
+        # pd.merge casts integers with missing values to float, compare as objects
+        np.testing.assert_array_equal(
+            res[~missing].astype(object).to_numpy(),
+            exp[~missing].astype(object).to_numpy(),
+            err_msg=col,
+        )
+        if not missing.any():
+            assert res.dtype == exp.dtype, col
+        elif pd.api.types.is_integer_dtype(exp.dtype):
+            # missing values must not turn integers into floats
+            assert pd.api.types.is_extension_array_dtype(res.dtype), col
+
+
+def random_table(rng, keys, columns, dtypes=("f4", "u8", "i2", "?", "S4", "cat")):
+    data = {"uid": keys}
+    for col in columns:
+        dtype = dtypes[col % len(dtypes)]
+        if dtype == "cat":
+            values = pd.Categorical(rng.choice(["a", "b", "c"], len(keys)))
+        elif dtype == "S4":
+            values = rng.choice([b"x", b"yy", b"zzz"], len(keys))
+        elif dtype == "?":
+            values = rng.random(len(keys)) > 0.5
+        else:
+            values = rng.integers(0, 100, len(keys)).astype(dtype)
+        data[f"col_{col}"] = values
+    return pd.DataFrame(data)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_random_tables(seed):
+    rng = np.random.default_rng(seed)
+    pool = np.unique(rng.integers(0, 2**64, 40, dtype=np.uint64))
+    n_tables = rng.integers(2, 5)
+    tables = []
+    for idx in range(n_tables):
+        n = rng.integers(0, 30)
+        # the first table can have duplicates (e.g. many particles per micrograph)
+        keys = rng.choice(pool, n, replace=idx == 0 or bool(rng.random() < 0.1))
+        # tables share some columns, which are only taken from the first one
+        columns = rng.choice(8, rng.integers(0, 5), replace=False)
+        tables.append(random_table(rng, keys, sorted(columns)))
+    assert_same_values(outer_join(tables, on="uid"), merge_all(tables, on="uid"))
+
+
+def test_duplicate_keys_first_table():
+    left = pd.DataFrame({"uid": np.array([3, 1, 3, 2], dtype=np.uint64), "a": range(4)})
+    right = pd.DataFrame({"uid": np.array([2, 3, 5], dtype=np.uint64), "b": [1, 2, 3]})
+    result = outer_join([left, right], on="uid")
+    assert_same_values(result, merge_all([left, right], on="uid"))
+    # rows with the same key keep their order
+    assert list(result["a"].iloc[2:4]) == [0, 2]
+
+
+def test_duplicate_keys_other_tables():
+    left = pd.DataFrame({"uid": [1, 2], "a": [1.0, 2.0]})
+    right = pd.DataFrame({"uid": [2, 2, 3], "b": [1, 2, 3]})
+    assert_same_values(
+        outer_join([left, right], on="uid"), merge_all([left, right], on="uid")
+    )
+
+
+def test_disjoint_keys():
+    left = pd.DataFrame({"uid": np.array([1, 2], dtype=np.uint64), "a": [1, 2]})
+    right = pd.DataFrame({"uid": np.array([3, 4], dtype=np.uint64), "b": [True, False]})
+    result = outer_join([left, right], on="uid")
+    assert_same_values(result, merge_all([left, right], on="uid"))
+    assert result["a"].dtype == "Int64"
+    assert result["b"].dtype == "boolean"
+
+
+def test_large_uids_keep_precision():
+    uids = np.array([2**63 + 1, 2**63 + 3], dtype=np.uint64)
+    left = pd.DataFrame({"uid": uids[:1], "mic": uids[1:]})
+    right = pd.DataFrame({"uid": uids[1:], "a": [1.0]})
+    result = outer_join([left, right], on="uid")
+    assert list(result["uid"]) == list(uids)
+    assert result["mic"].iloc[0] == uids[1]
+
+
+def test_nullable_and_categorical():
+    left = pd.DataFrame(
+        {
+            "uid": [1, 2, 3],
+            "a": pd.array([1, None, 3], dtype="Int32"),
+            "cat": pd.Categorical(["x", "y", "x"]),
+        }
+    )
+    right = pd.DataFrame(
+        {"uid": [3, 4], "b": pd.array([True, None], dtype="boolean"), "a": [9, 9]}
+    )
+    result = outer_join([left, right], on="uid")
+    assert_same_values(result, merge_all([left, right], on="uid"))
+    assert result["a"].dtype == "Int32"
+    assert isinstance(result["cat"].dtype, pd.CategoricalDtype)
+
+
+def test_object_keys():
+    left = pd.DataFrame({"uid": ["b", "a"], "x": [1, 2]})
+    right = pd.DataFrame({"uid": ["c", "a"], "y": [3.0, 4.0]})
+    assert_same_values(
+        outer_join([left, right], on="uid"), merge_all([left, right], on="uid")
+    )
+
+
+def test_single_table():
+    table = pd.DataFrame({"uid": [2, 1], "a": [1, 2]})
+    assert outer_join([table], on="uid") is table
@@ -0,0 +1,82 @@
+import pandas as pd
+import pytest
+
+from stemia.cryosparc.csplot import parse
+from stemia.cryosparc.csplot.parse import LazyJobData, load_job_data
+
+
+@pytest.fixture
+def merges(monkeypatch):
+    """Columns requested in each call to merge_job_data."""
+    calls = []
+    merge = parse.merge_job_data
+
+    def spy(files, columns=None, **kwargs):
+        calls.append(columns)
+        return merge(files, columns=columns, **kwargs)
+
+    monkeypatch.setattr(parse, "merge_job_data", spy)
+    return calls
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_lazy_job_data(cs_project, merges, cache):
+    data = LazyJobData(cs_project / "J3", cache=cache)
+    assert len(merges) == 1
+
+    data.get(["ctf/*"])
+    assert len(merges) == 2
+    # already loaded, directly or through a pattern
+    data.get(["uid", "ctf/df1_A", "index", None, "ctf/df*"])
+    # not in any cs file
+    data.get(["does/not_exist"])
+    assert len(merges) == 2
+
+    data.get(["alignments3D/pose_1"])
+    assert len(merges) == 3
+    # only the new fields are read
+    assert merges[-1] == [
+        "alignments3D/pose_0",
+        "alignments3D/pose_1",
+        "alignments3D/pose_2",
+    ]
+
+    columns = ["ctf/*", "alignments3D/pose"]
+    expected = load_job_data(cs_project / "J3", columns=columns, cache=False)
+    pd.testing.assert_frame_equal(
+        data.df[expected.columns].reset_index(drop=True),
+        expected.reset_index(drop=True),
+    )
+
+
+def test_cache_loads_only_new_columns(cs_project, merges):
+    first = load_job_data(cs_project / "J3", columns=["ctf/*"])
+    assert load_job_data(cs_project / "J3", columns=["ctf/*"]).equals(first)
+    assert len(merges) == 1
+
+    df = load_job_data(cs_project / "J3", columns=["ctf/*", "alignments3D/error"])
+    assert merges[-1] == ["alignments3D/error"]
+    expected = load_job_data(
+        cs_project / "J3", columns=["ctf/*", "alignments3D/error"], cache=False
+    )
+    pd.testing.assert_frame_equal(
+        df[expected.columns].reset_index(drop=True), expected.reset_index(drop=True)
+    )
+
+
+@pytest.mark.parametrize("cache", [False, True])
+def test_no_data_of_requested_kind(cs_project, cache):
+    # J1 only has micrographs
+    df = load_job_data(cs_project / "J1", micrographs=False, cache=cache)
+    assert isinstance(df, pd.DataFrame)
+    assert df.empty
+    df = load_job_data(cs_project / "J1", particles=False, cache=cache)
+    assert len(df) == 20
+    assert "ctf/ctf_fit_to_A" in df.columns
+
+
+def test_export_without_data(cs_project, tmp_path):
+    from stemia.cryosparc.csplot.export import export_job
+
+    with pytest.raises(ValueError, match="no particle or micrograph data"):
+        export_job(cs_project / "J1", tmp_path, micrographs=False)
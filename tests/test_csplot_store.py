@@ -0,0 +1,135 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import REFINE_DTYPE, write_cs, write_job
+
+from stemia.cryosparc.csplot.parse import load_job_data
+from stemia.cryosparc.csplot.store import POSE_COLUMNS, JobStore
+
+
+@pytest.fixture
+def split_project(cs_project, tmp_path):
+    """
+    Copy of the project, with more jobs.
+
+    J5: split of the particles of J3 in 2 sets
+    J6: refinement of the first set of J5
+    """
+    project = tmp_path / "P1"
+    shutil.copytree(cs_project, project)
+    write_job(
+        project,
+        "J5",
+        "particle_sets",
+        ["J3"],
+        [
+            (f"split_{idx}", [f"J5/J5_particles_split_{idx}.cs"], False)
+            for idx in range(2)
+        ],
+    )
+    # the sets hold all the particle data
+    passthrough = np.load(project / "J3" / "J3_passthrough_particles.cs")
+    for idx, split in enumerate([passthrough[:200], passthrough[200:]]):
+        with open(project / "J5" / f"J5_particles_split_{idx}.cs", "wb") as f:
+            np.save(f, split)
+    write_job(
+        project,
+        "J6",
+        "homo_refine_new",
+        ["J5"],
+        [
+            ("particles", ["J6/J6_particles.cs"], False),
+            ("particles", ["J5/J5_particles_split_0.cs"], True),
+        ],
+    )
+    write_cs(
+        project / "J6" / "J6_particles.cs",
+        REFINE_DTYPE,
+        200,
+        np.random.default_rng(1),
+        uid=passthrough["uid"][:200],
+    )
+    return project
+
+
+def assert_same_data(result, expected):
+    key = result.columns[0]
+    assert sorted(result.columns) == sorted(expected.columns)
+    expected = expected.sort_values(key, ignore_index=True)[result.columns]
+    assert len(result) == len(expected)
+    for col in result.columns:
+        res = result[col]
+        exp = expected[col]
+        missing = exp.isna().to_numpy()
+        np.testing.assert_array_equal(res.isna().to_numpy(), missing, err_msg=col)
+        np.testing.assert_array_equal(
+            res[~missing].astype(object).to_numpy(),
+            exp[~missing].astype(object).to_numpy(),
+            err_msg=col,
+        )
+
+
+@pytest.mark.parametrize("columns", [None, ["ctf/*", "alignments3D/pose_?"]])
+def test_get(cs_project, columns):
+    store = JobStore(columns=columns)
+    for job in ["J1", "J2", "J3", "J4"]:
+        store.add(cs_project / job)
+    for job in ["J1", "J2", "J3", "J4"]:
+        expected = load_job_data(cs_project / job, columns=columns, cache=False)
+        assert_same_data(store.get(job), expected)
+
+
+def test_diff(cs_project):
+    store = JobStore()
+    store.add(cs_project / "J3")
+    store.add(cs_project / "J4")
+    j3 = load_job_data(cs_project / "J3", cache=False)["uid"].to_numpy()
+    j4 = load_job_data(cs_project / "J4", cache=False)["uid"].to_numpy()
+
+    diff = store.diff("J3", "J4")
+    np.testing.assert_array_equal(diff["added"], [])
+    np.testing.assert_array_equal(diff["removed"], np.setdiff1d(j3, j4))
+    np.testing.assert_array_equal(diff["common"], np.intersect1d(j3, j4))
+    assert (len(diff["removed"]), len(diff["common"])) == (150, 300)
+
+    reverse = store.diff("J4", "J3")
+    np.testing.assert_array_equal(reverse["added"], diff["removed"])
+    np.testing.assert_array_equal(reverse["removed"], [])
+
+
+def test_changed(cs_project):
+    store = JobStore()
+    store.add(cs_project / "J3")
+    store.add(cs_project / "J4")
+    cols = ["uid", *POSE_COLUMNS]
+    j3 = load_job_data(cs_project / "J3", columns=POSE_COLUMNS, cache=False)[cols]
+    j4 = load_job_data(cs_project / "J4", columns=POSE_COLUMNS, cache=False)[cols]
+    merged = pd.merge(j3, j4, on="uid", suffixes=("_a", "_b"))
+    different = np.zeros(len(merged), dtype=bool)
+    for col in POSE_COLUMNS:
+        different |= (merged[f"{col}_a"] != merged[f"{col}_b"]).to_numpy()
+    expected = np.sort(merged["uid"].to_numpy()[different])
+
+    changed = store.changed("J3", "J4")
+    np.testing.assert_array_equal(changed, expected)
+    # every other pose of J4 is the same as in J3
+    assert len(changed) == 150
+    assert len(store.changed("J3", "J4", columns=["blob/path"])) == 0
+    assert len(store.changed("J3", "J3")) == 0
+
+
+def test_groups_hold_data_once(split_project):
+    store = JobStore()
+    store.add(split_project / "J3")
+    store.add(split_project / "J5")
+    group = tuple(sorted((split_project / "J5").glob("J5_particles_split_*.cs")))
+    assert group in store._groups
+    assert not set(group) & set(store.tables)
+    # the table of a single file of the group is still available
+    store.add(split_project / "J6")
+    for job in ["J3", "J5", "J6"]:
+        expected = load_job_data(split_project / job, cache=False)
+        assert_same_data(store.get(job), expected)
+    assert not set(group) & set(store.tables)
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.signal import find_peaks
+
+from stemia.image.project_profiles.funcs import (
+    find_peaks_rows,
+    rolling_mean,
+    stack_profiles,
+    top_two_peaks,
+)
+
+
+def random_profiles(seed, n=200):
+    """Profiles of various lengths, with plateaus, NaN edges and few peaks."""
+    rng = np.random.default_rng(seed)
+    profiles = []
+    for idx in range(n):
+        length = rng.integers(1, 60)
+        # few distinct values, so there are many plateaus and equal peaks
+        profile = np.round(rng.random(length), 1)
+        kind = idx % 5
+        if kind == 1:
+            # outside of the re-extracted volume at the edges
+            profile[: rng.integers(0, length + 1)] = np.nan
+            profile[length - rng.integers(0, length + 1) :] = np.nan
+        elif kind == 2:
+            profile = np.sort(profile)
+        elif kind == 3:
+            profile[:] = profile[0]
+        elif kind == 4:
+            profile = np.repeat(profile, rng.integers(1, 4))[:length]
+        profiles.append(profile)
+    return profiles
+
+
+@pytest.fixture(params=[0, 1, 2])
+def profiles(request):
+    return random_profiles(request.param)
+
+
+def test_rolling_mean(profiles):
+    stacked, lengths = stack_profiles(profiles)
+    result = rolling_mean(stacked, window=5)
+    for row, profile, length in zip(result, profiles, lengths):
+        expected = pd.Series(profile).rolling(window=5, min_periods=1).mean()
+        np.testing.assert_allclose(row[:length], expected.to_numpy())
+
+
+@pytest.mark.parametrize("smooth", [False, True])
+def test_find_peaks_rows(profiles, smooth):
+    stacked, lengths = stack_profiles(profiles)
+    if smooth:
+        stacked = rolling_mean(stacked, window=5)
+    result = find_peaks_rows(stacked, lengths, height=0.2)
+    for row, values, length in zip(result, stacked, lengths):
+        expected, _ = find_peaks(values[:length], height=0.2)
+        np.testing.assert_array_equal(np.flatnonzero(row), expected)
+
+
+@pytest.mark.parametrize("smooth", [False, True])
+def test_top_two_peaks(profiles, smooth):
+    stacked, lengths = stack_profiles(profiles)
+    if smooth:
+        stacked = rolling_mean(stacked, window=5)
+    order, has_two = top_two_peaks(stacked, lengths, height=0.2)
+    counts = []
+    for positions, two, values, length in zip(order, has_two, stacked, lengths):
+        loc, props = find_peaks(values[:length], height=0.2)
+        counts.append(len(loc))
+        assert two == (len(loc) >= 2)
+        if two:
+            top = loc[props["peak_heights"].argsort(kind="stable")][-2:]
+            np.testing.assert_array_equal(positions, top)
+    # the profiles cover rows with no, one and several peaks
+    assert {0, 1} <= set(counts) and max(counts) >= 2
@@ -0,0 +1,46 @@
+import mrcfile
+import numpy as np
+import pytest
+from click.testing import CliRunner
+from scipy.ndimage import zoom
+
+from stemia.image.rescale import cli
+
+
+def blobs(shape, sigma=4):
+    """Smooth test image (gaussian blobs that fade out before the edges)."""
+    grid = np.indices(shape, dtype=np.float32)
+    img = np.zeros(shape, dtype=np.float32)
+    rng = np.random.default_rng(0)
+    for _ in range(4):
+        center = rng.uniform(0.3, 0.7, len(shape)) * shape
+        dist_sq = sum((g - c) ** 2 for g, c in zip(grid, center))
+        img += np.exp(-dist_sq / (2 * sigma**2))
+    return img
+
+
+def rescale(tmp_path, img, *args):
+    inp = tmp_path / "in.mrc"
+    out = tmp_path / "out.mrc"
+    with mrcfile.new(inp, img, overwrite=True) as mrc:
+        mrc.voxel_size = 1
+    result = CliRunner().invoke(cli, [str(inp), str(out), "1.3", "-f", *args])
+    assert result.exit_code == 0, result.output
+    return mrcfile.read(out)
+
+
+# more than 32 planes, so the volume is split in several slabs
+@pytest.mark.parametrize("shape", [(80, 40, 48), (97, 33, 21)])
+def test_chunked_matches_zoom(tmp_path, shape):
+    img = np.random.default_rng(0).standard_normal(shape).astype(np.float32)
+    out = rescale(tmp_path, img, "-m", "chunked")
+    np.testing.assert_allclose(out, zoom(img, 1 / 1.3), rtol=0, atol=1e-5)
+
+
+@pytest.mark.parametrize("out_of_core", [False, True])
+def test_fourier_matches_zoom(tmp_path, out_of_core):
+    img = blobs((80, 40, 48))
+    args = ["-m", "fourier"] + (["--out-of-core"] if out_of_core else [])
+    out = rescale(tmp_path, img, *args)
+    # pixel grids differ slightly between the two methods
+    np.testing.assert_allclose(out, zoom(img, 1 / 1.3), rtol=0, atol=0.05)
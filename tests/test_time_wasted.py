@@ -0,0 +1,29 @@
+import numpy as np
+
+from stemia.cryosparc.time_wasted import _to_ns
+
+EPOCH_2021 = 1_609_459_200_000_000_000
+
+
+def test_to_ns():
+    dates = [
+        {"$date": 1_609_459_200_000},
+        None,
+        {"$date": "2021-01-01T00:00:00.123Z"},
+        {"$date": "2021-01-01T00:00:01Z"},
+        {"$date": "2021-01-01T01:00:00+01:00"},
+        {"$date": "2021-01-01T00:00:00"},
+    ]
+    ns, is_set = _to_ns(dates)
+    np.testing.assert_array_equal(
+        ns,
+        [
+            EPOCH_2021,
+            0,
+            EPOCH_2021 + 123_000_000,
+            EPOCH_2021 + 1_000_000_000,
+            EPOCH_2021,
+            EPOCH_2021,
+        ],
+    )
+    np.testing.assert_array_equal(is_set, [True, False, True, True, True, True])